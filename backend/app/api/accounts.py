@@ -0,0 +1,85 @@
+import httpx
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from app.auth.schemas import CurrentUser
+from app.auth.utils import get_current_user
+from app.config import settings
+from app.database import get_async_db
+from app.insights.graph import graph_client
+from app.models import AdAccount, get_user_by_email
+
+router = APIRouter()
+
+class AdAccountRequest(BaseModel):
+    account_id: str = Field(..., min_length=1)
+    name: Optional[str] = None
+    access_token: Optional[str] = None
+
+def _serialize(account: AdAccount) -> dict:
+    # The access token is write-only.
+    return {"account_id": account.account_id, "name": account.name, "has_token": bool(account.access_token)}
+
+async def _user_id(db: AsyncSession, user: CurrentUser) -> int:
+    db_user = await get_user_by_email(db, user.email)
+    if not db_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return db_user.id
+
+@router.get("/ad-accounts")
+async def list_ad_accounts(user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    user_id = await _user_id(db, user)
+    result = await db.execute(select(AdAccount).where(AdAccount.user_id == user_id).order_by(AdAccount.account_id))
+    return {"accounts": [_serialize(account) for account in result.scalars()]}
+
+@router.post("/ad-accounts", status_code=201)
+async def add_ad_account(
+    data: AdAccountRequest,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Registers an ad account for the current user. Its token must be able to
+    read the account; only SHARED_AD_ACCOUNTS may be added without one.
+    """
+    account_id = data.account_id.removeprefix("act_")
+    if data.access_token:
+        try:
+            allowed = await graph_client.can_read_account(account_id, data.access_token)
+        except httpx.HTTPError:
+            raise HTTPException(status_code=502, detail="Could not reach Facebook to verify the ad account")
+        if not allowed:
+            raise HTTPException(status_code=403, detail="The access token cannot read this ad account")
+    elif account_id not in settings.SHARED_AD_ACCOUNTS:
+        raise HTTPException(status_code=400, detail="An access token is required for this ad account")
+
+    account = AdAccount(
+        user_id=await _user_id(db, user),
+        account_id=account_id,
+        name=data.name,
+        access_token=data.access_token,
+    )
+    db.add(account)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Ad account already registered")
+    return _serialize(account)
+
+@router.delete("/ad-accounts/{account_id}")
+async def remove_ad_account(
+    account_id: str,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    result = await db.execute(
+        delete(AdAccount).where(AdAccount.user_id == await _user_id(db, user), AdAccount.account_id == account_id)
+    )
+    await db.commit()
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Ad account not found")
+    return {"message": f"Ad account {account_id} removed"}
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.profiling import is_profile_admin, profiles, slow_queries
+
+router = APIRouter()
+
+def require_profile_admin(x_profile: Optional[str] = Header(None)):
+    if not is_profile_admin(x_profile):
+        raise HTTPException(status_code=403, detail="Profiling access denied")
+
+@router.get("/profiles", dependencies=[Depends(require_profile_admin)])
+def list_profiles():
+    return {"profiles": profiles.list()}
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_profile_admin)])
+def get_profile(profile_id: int):
+    profile = profiles.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(
+        profile.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+    )
+
+@router.get("/slow-queries", dependencies=[Depends(require_profile_admin)])
+def list_slow_queries():
+    return {"queries": list(reversed(slow_queries))}
@@ -1,118 +1,386 @@
-import os
-import httpx
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional, List
+import csv
+import io
+import json
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Callable, List, Optional, TypeVar
+from app.api.responses import NO_STORE, json_response, range_cache_control
+from app.database import SessionLocal, get_db
+from app.insights.aggregate import BUCKETS, DIMENSIONS
+from app.insights.cube import InsightsCube, cube_cache
+from app.auth.utils import decode_token
+from app.insights.accounts import AccountRef, accounts_for_user, default_accounts, readable_accounts, sync_accounts
+from app.insights.graph import graph_client
+from app.insights.stream import stream_hub
+from app.insights.sync import history_window, sync_cache
+from app.models import InsightCampaignTotal
 
 router = APIRouter()
-
-FB_ACCESS_TOKEN = os.getenv("FB_ACCESS_TOKEN")
-FB_AD_ACCOUNT_ID = os.getenv("FB_AD_ACCOUNT_ID")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
 VALID_METRICS = {"clicks", "impressions", "cpc", "ctr"}
 
 def get_default_publisher_platforms():
     return ["facebook", "instagram", "audience_network", "messenger"]
 
+def parse_date_range(since: str, until: str):
+    try:
+        since_date, until_date = date.fromisoformat(since), date.fromisoformat(until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+    if since_date > until_date:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    return since_date, until_date
+
+def get_accounts(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> List[AccountRef]:
+    """
+    The ad accounts a request covers: the signed-in user's registered
+    accounts, or the FB_AD_ACCOUNT_ID account for anonymous requests and
+    users who have not registered any.
+    """
+    if token:
+        payload = decode_token(token)
+        if not payload or not payload.get("email"):
+            raise HTTPException(status_code=401, detail="Invalid token")
+        accounts = accounts_for_user(db, payload["email"])
+        if accounts:
+            return accounts
+    accounts = default_accounts()
+    if not accounts:
+        raise HTTPException(status_code=500, detail="Missing FB access token or ad account ID")
+    return accounts
+
+def partial_headers(failed: List[str]) -> dict:
+    return {"X-Insights-Failed-Accounts": ",".join(failed)} if failed else {}
+
+T = TypeVar("T")
+
+async def from_cube(db: Session, account_ids: List[str], since: date, until: date, build: Callable[[InsightsCube], T]) -> T:
+    """
+    Loads the range's cube and builds the payload from it in the threadpool:
+    the cube build queries the database and both steps are CPU-bound, so
+    neither should run on the event loop.
+    """
+    return await run_in_threadpool(lambda: build(cube_cache.get(db, account_ids, since, until)))
+
 @router.get("/fb-insights/monthly")
 async def get_monthly_insights(
+    request: Request,
     since: str = Query(..., description="Start date in YYYY-MM-DD"),
     until: str = Query(..., description="End date in YYYY-MM-DD"),
-    metric: str = Query("clicks", description="Metric to fetch", regex="^(clicks|impressions|cpc|ctr)$")
+    metric: str = Query("clicks", description="Metric to fetch", regex="^(clicks|impressions|cpc|ctr)$"),
+    accounts: List[AccountRef] = Depends(get_accounts),
+    db: Session = Depends(get_db),
 ):
     """
     Returns daily insights grouped by campaign and publisher platform
-    for the given date range and metric.
+    for the given date range and metric, served from the local store.
     """
-    if not FB_ACCESS_TOKEN or not FB_AD_ACCOUNT_ID:
-        raise HTTPException(status_code=500, detail="Missing FB access token or ad account ID")
-
     if metric not in VALID_METRICS:
         raise HTTPException(status_code=400, detail=f"Invalid metric: {metric}")
 
-    url = f"https://graph.facebook.com/v23.0/act_{FB_AD_ACCOUNT_ID}/insights"
-    params = {
-        "fields": f"date_start,campaign_name,clicks,impressions,cpc,ctr",
-        "breakdowns": "publisher_platform",
-        "time_range": f'{{"since":"{since}","until":"{until}"}}',
-        "time_increment": "1",
-        "level": "ad",  
-        "access_token": FB_ACCESS_TOKEN,
-        "limit": 1000, 
-    }
+    since_date, until_date = parse_date_range(since, until)
+    account_ids, failed = await sync_accounts(accounts, since_date, until_date)
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail=response.json())
+    results = await from_cube(db, account_ids, since_date, until_date, lambda cube: [
+        {"date": day, "campaign": campaign, "publisher_platform": platform, "metric_value": value}
+        for day, campaign, platform, value in zip(
+            cube.decode("date").tolist(),
+            cube.decode("campaign").tolist(),
+            cube.decode("publisher_platform").tolist(),
+            cube.metrics[metric].tolist(),
+        )
+    ])
 
-        data = response.json().get("data", [])
+    return await json_response(request, results, range_cache_control(until_date, failed=failed), partial_headers(failed))
 
 
-        results = []
-        for item in data:
-            results.append({
-                "date": item.get("date_start"),
-                "campaign": item.get("campaign_name"),
-                "publisher_platform": item.get("publisher_platform", "unknown"),
-                "metric_value": float(item.get(metric, 0)) if metric in ["cpc", "ctr"] else int(item.get(metric, 0)),
-            })
+@router.get("/fb-insights/combined")
+async def get_combined_insights(
+    request: Request,
+    since: str = Query(..., description="Start date in YYYY-MM-DD"),
+    until: str = Query(..., description="End date in YYYY-MM-DD"),
+    accounts: List[AccountRef] = Depends(get_accounts),
+    db: Session = Depends(get_db),
+):
+    """
+    Returns clicks, impressions, spend, cpc and ctr for the range in one
+    columnar payload: each row is a position in the parallel arrays, and its date,
+    campaign and platform are indexes into the shared dictionaries.
+    """
+    since_date, until_date = parse_date_range(since, until)
+    account_ids, failed = await sync_accounts(accounts, since_date, until_date)
 
-        return results
+    payload = await from_cube(db, account_ids, since_date, until_date, lambda cube: {
+        "since": since_date.isoformat(),
+        "until": until_date.isoformat(),
+        "rows": len(cube),
+        "dates": cube.date_labels(),
+        "campaigns": cube.values["campaign"],
+        "platforms": cube.values["publisher_platform"],
+        "columns": {
+            "date": cube.codes["date"],
+            "campaign": cube.codes["campaign"],
+            "publisher_platform": cube.codes["publisher_platform"],
+            **{name: cube.metrics[name] for name in ("clicks", "impressions", "spend", "cpc", "ctr")},
+        },
+    })
+    return await json_response(request, payload, range_cache_control(until_date, failed=failed), partial_headers(failed))
 
 
-@router.get("/fb-insights/all-time")
-async def get_all_time_insights(
-    limit: int = Query(100, ge=1, le=500),
+@router.get("/fb-insights/aggregate")
+async def get_aggregated_insights(
+    request: Request,
+    since: str = Query(..., description="Start date in YYYY-MM-DD"),
+    until: str = Query(..., description="End date in YYYY-MM-DD"),
+    group_by: str = Query("campaign", description="Comma-separated dimensions: campaign, publisher_platform"),
+    bucket: Optional[str] = Query(None, description="Time bucket", regex="^(day|week|month)$"),
+    accounts: List[AccountRef] = Depends(get_accounts),
+    db: Session = Depends(get_db),
 ):
+    """
+    Returns pre-aggregated series grouped by the requested dimensions and
+    optional day/week/month bucket, with cpc and ctr derived from the sums.
+    """
+    dimensions = [name.strip() for name in group_by.split(",") if name.strip()]
+    invalid = [name for name in dimensions if name not in DIMENSIONS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid group_by dimension(s): {', '.join(invalid)}")
+    if bucket and bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Invalid bucket: {bucket}")
 
-    if not FB_ACCESS_TOKEN or not FB_AD_ACCOUNT_ID:
-        raise HTTPException(status_code=500, detail="Missing FB access token or ad account ID")
+    since_date, until_date = parse_date_range(since, until)
+    account_ids, failed = await sync_accounts(accounts, since_date, until_date)
+
+    def build(cube: InsightsCube) -> List[dict]:
+        labels, sums = cube.group_sum(dimensions, bucket)
+        names = list(labels) + ["clicks", "impressions", "spend", "cpc", "ctr"]
+        columns = [labels[name].tolist() for name in labels] + [sums[name].tolist() for name in names[len(labels):]]
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+    return await json_response(request, {
+        "group_by": dimensions,
+        "bucket": bucket,
+        "data": await from_cube(db, account_ids, since_date, until_date, build),
+    }, range_cache_control(until_date, failed=failed), partial_headers(failed))
+
+
+@router.get("/fb-insights/top")
+async def get_top_insights(
+    request: Request,
+    since: str = Query(..., description="Start date in YYYY-MM-DD"),
+    until: str = Query(..., description="End date in YYYY-MM-DD"),
+    dimension: str = Query("campaign", description="Dimension to rank", regex="^(campaign|publisher_platform)$"),
+    metric: str = Query("clicks", description="Metric to rank by", regex="^(clicks|impressions|spend|cpc|ctr)$"),
+    limit: int = Query(10, ge=1, le=500),
+    min_impressions: int = Query(0, ge=0, description="Skip groups with fewer impressions over the range"),
+    order: str = Query("desc", regex="^(asc|desc)$"),
+    accounts: List[AccountRef] = Depends(get_accounts),
+    db: Session = Depends(get_db),
+):
+    """
+    Returns the top ``limit`` campaigns or platforms by a metric over the
+    range. cpc and ctr are derived from the summed totals, and groups under
+    ``min_impressions`` are left out before ranking.
+    """
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid dimension: {dimension}")
 
-    url = f"https://graph.facebook.com/v18.0/act_{FB_AD_ACCOUNT_ID}/insights"
-    params = {
-        "fields": "campaign_name,clicks,impressions,cpc,ctr",
-        "level": "campaign",
-        "access_token": FB_ACCESS_TOKEN,
-        "limit": 100, 
-        "date_preset": "maximum",
+    since_date, until_date = parse_date_range(since, until)
+    account_ids, failed = await sync_accounts(accounts, since_date, until_date)
+
+    def build(cube: InsightsCube) -> List[dict]:
+        labels, sums = cube.top_k(dimension, metric, limit, min_impressions=min_impressions, ascending=order == "asc")
+        names = ["clicks", "impressions", "spend", "cpc", "ctr"]
+        columns = [labels.tolist()] + [sums[name].tolist() for name in names]
+        return [
+            {"rank": rank, **dict(zip([dimension] + names, row))}
+            for rank, row in enumerate(zip(*columns), start=1)
+        ]
+
+    return await json_response(request, {
+        "dimension": dimension,
+        "metric": metric,
+        "order": order,
+        "limit": limit,
+        "data": await from_cube(db, account_ids, since_date, until_date, build),
+    }, range_cache_control(until_date, failed=failed), partial_headers(failed))
+
+
+EXPORT_COLUMNS = ["date", "campaign", "ad", "publisher_platform", "clicks", "impressions", "cpc", "ctr"]
+
+def _export_row(item: dict) -> dict:
+    return {
+        "date": item.get("date_start"),
+        "campaign": item.get("campaign_name"),
+        "ad": item.get("ad_name"),
+        "publisher_platform": item.get("publisher_platform", "unknown"),
+        "clicks": int(item.get("clicks", 0)),
+        "impressions": int(item.get("impressions", 0)),
+        "cpc": float(item.get("cpc", 0)),
+        "ctr": float(item.get("ctr", 0)),
     }
 
-    collected_data = []
-    after_cursor = None
+def _encode_ndjson(page: List[dict]) -> str:
+    return "".join(json.dumps(_export_row(item)) + "\n" for item in page)
+
+def _encode_csv(page: List[dict]) -> str:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    for item in page:
+        writer.writerow(_export_row(item))
+    return buffer.getvalue()
+
+@router.get("/fb-insights/export")
+async def export_insights(
+    since: str = Query(..., description="Start date in YYYY-MM-DD"),
+    until: str = Query(..., description="End date in YYYY-MM-DD"),
+    format: str = Query("ndjson", description="Export format", regex="^(ndjson|csv)$"),
+    account_id: Optional[str] = Query(None, description="Ad account; defaults to the first one available"),
+    accounts: List[AccountRef] = Depends(get_accounts),
+):
+    """
+    Streams ad-level daily insights per publisher platform straight from Graph,
+    flushing each page as it arrives instead of buffering the whole range.
+    One account is exported per request, read with its own token.
+    """
+    since_date, until_date = parse_date_range(since, until)
+    if account_id:
+        accounts = [a for a in accounts if a.account_id == account_id.removeprefix("act_")]
+    if not accounts:
+        raise HTTPException(status_code=404, detail="Ad account not found")
+    readable, _ = await readable_accounts(accounts[:1])
+    account = readable[0]
+    pages = graph_client.iter_insights(account.account_id, account.access_token, since_date, until_date)
+    encode = _encode_csv if format == "csv" else _encode_ndjson
 
-    async with httpx.AsyncClient() as client:
-        while True:
-            if after_cursor:
-                params["after"] = after_cursor
-            response = await client.get(url, params=params)
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.json())
-            json_data = response.json()
-            data = json_data.get("data", [])
-            paging = json_data.get("paging", {})
-            after_cursor = paging.get("cursors", {}).get("after")
+    # Pull the first page before committing to a 200 so Graph errors still
+    # surface as a proper status code.
+    try:
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = []
 
-            collected_data.extend(data)
+    async def stream():
+        if format == "csv":
+            yield ",".join(EXPORT_COLUMNS) + "\r\n"
+        yield encode(first_page)
+        async for page in pages:
+            yield encode(page)
 
-            if not after_cursor or len(collected_data) >= limit:
-                break
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"insights_{since_date}_{until_date}.{format}"
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
-    collected_data = collected_data[:limit]
+
+@router.get("/fb-insights/all-time")
+async def get_all_time_insights(
+    request: Request,
+    limit: int = Query(100, ge=1, le=500),
+    accounts: List[AccountRef] = Depends(get_accounts),
+    db: Session = Depends(get_db),
+):
+    """
+    Per-campaign totals over every stored day, read from the all-time rollup.
+    The history window is synced first so the totals do not depend on which
+    ranges were opened before; ``complete`` is false when an account's sync
+    failed and its totals may be missing days. Campaigns are ordered by name
+    and ``limit`` applies after ordering.
+    """
+    since_date, until_date = history_window()
+    account_ids, failed = await sync_accounts(accounts, since_date, until_date)
+    total_clicks = func.sum(InsightCampaignTotal.clicks)
+    total_impressions = func.sum(InsightCampaignTotal.impressions)
+    total_spend = func.sum(InsightCampaignTotal.spend)
+    query = (
+        db.query(
+            InsightCampaignTotal.campaign,
+            func.min(InsightCampaignTotal.first_date),
+            total_clicks,
+            total_impressions,
+            total_spend,
+        )
+        .filter(InsightCampaignTotal.account_id.in_(account_ids))
+        .group_by(InsightCampaignTotal.campaign)
+        .order_by(InsightCampaignTotal.campaign)
+        .limit(limit)
+    )
+    rows = await run_in_threadpool(query.all)
 
     formatted = [
         {
-            "campaign": item.get("campaign_name"),
-            "date": item.get("date_start"),
-            "clicks": int(item.get("clicks", 0)),
-            "impressions": int(item.get("impressions", 0)),
-            "cpc": float(item.get("cpc", 0)),
-            "ctr": float(item.get("ctr", 0)),
+            "campaign": campaign,
+            "date": first_day.isoformat(),
+            "clicks": int(total_clicks or 0),
+            "impressions": int(total_impressions or 0),
+            "cpc": float(total_spend / total_clicks) if total_clicks else 0.0,
+            "ctr": float(total_clicks / total_impressions * 100) if total_impressions else 0.0,
         }
-        for item in collected_data
-        if item.get("campaign_name")
+        for campaign, first_day, total_clicks, total_impressions, total_spend in rows
     ]
 
-    return {
+    return await json_response(request, {
+        "since": since_date.isoformat(),
+        "until": until_date.isoformat(),
+        "complete": not failed,
         "limit": limit,
         "data": formatted,
-    }
+    }, range_cache_control(until_date, failed=failed), partial_headers(failed))
+
+
+@router.get("/fb-insights/stream")
+async def stream_insights(
+    since: str = Query(..., description="Start date in YYYY-MM-DD"),
+    until: str = Query(..., description="End date in YYYY-MM-DD"),
+    account_id: Optional[str] = Query(None, description="Ad account; defaults to the first one available"),
+    token: Optional[str] = Query(None, description="Access token, for EventSource clients that cannot set headers"),
+    bearer: Optional[str] = Depends(optional_oauth2_scheme),
+):
+    """
+    Server-sent events for a range: a ``snapshot`` of every row on connect,
+    then ``update`` events carrying only changed and removed rows as fresh
+    insights land. Comment lines are sent as heartbeats.
+    """
+    payload = decode_token(token or bearer or "")
+    if not payload or not payload.get("email"):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    since_date, until_date = parse_date_range(since, until)
+
+    def load_accounts() -> List[AccountRef]:
+        db = SessionLocal()
+        try:
+            return accounts_for_user(db, payload["email"]) or default_accounts()
+        finally:
+            db.close()
+
+    accounts = await run_in_threadpool(load_accounts)
+    if account_id:
+        accounts = [a for a in accounts if a.account_id == account_id.removeprefix("act_")]
+    if not accounts:
+        raise HTTPException(status_code=404, detail="Ad account not found")
+    await readable_accounts(accounts[:1])
+    if stream_hub.full():
+        raise HTTPException(status_code=503, detail="Too many open streams", headers={"Retry-After": "30"})
+
+    return StreamingResponse(
+        stream_hub.subscribe(accounts[0], since_date, until_date),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/fb-insights/cache-stats")
+async def get_insights_cache_stats(request: Request):
+    return await json_response(request, sync_cache.stats(), NO_STORE)
@@ -0,0 +1,27 @@
+import hmac
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from app.config import settings
+from app.database import get_db
+from app.insights.ingest import enqueue
+
+router = APIRouter()
+
+class IngestRequest(BaseModel):
+    account_id: str = Field(..., min_length=1)
+    data: List[dict]
+    source: str = "webhook"
+    # True when data holds every row Graph has for the days it covers.
+    complete: bool = False
+
+def require_ingest_token(x_ingest_token: Optional[str] = Header(None)):
+    if not settings.INGEST_TOKEN or not x_ingest_token or not hmac.compare_digest(x_ingest_token, settings.INGEST_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid ingest token")
+
+@router.post("/ingest/insights", status_code=202, dependencies=[Depends(require_ingest_token)])
+def ingest_insights(data: IngestRequest, db: Session = Depends(get_db)):
+    """Queues raw Graph insight rows; they are written by the ingest worker."""
+    batch = enqueue(db, data.account_id.removeprefix("act_"), data.data, data.source, complete_days=data.complete)
+    return {"batch_id": batch.id, "rows": batch.rows, "status": batch.status}
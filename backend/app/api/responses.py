@@ -0,0 +1,77 @@
+"""
+JSON responses for the insights endpoints: orjson encoding (NumPy arrays
+included), content-hash
+ETags with If-None-Match handling, and gzip (or brotli, when installed)
+above INSIGHTS_COMPRESS_MIN_BYTES. Compression runs in the threadpool so a
+large payload does not stall the event loop.
+"""
+import gzip
+import hashlib
+from datetime import date
+from typing import Any, Optional, Sequence
+import orjson
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from app.config import settings
+from app.insights.sync import first_open_day
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+NO_STORE = "no-store"
+
+def short_lived() -> str:
+    return f"private, max-age={int(settings.INSIGHTS_CACHE_TTL)}"
+
+def range_cache_control(until: date, today: date = None, failed: Sequence[str] = ()) -> str:
+    """
+    Ranges that end before the attribution window are never re-synced, so
+    their payload can be cached forever; anything more recent may still change.
+    A payload missing ``failed`` accounts' latest rows must be revalidated.
+    """
+    if failed:
+        return REVALIDATE
+    if until < first_open_day(today):
+        return IMMUTABLE
+    return short_lived()
+
+def _accepts(request: Request, encoding: str) -> bool:
+    accepted = request.headers.get("accept-encoding", "")
+    return any(part.split(";")[0].strip() == encoding for part in accepted.split(","))
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # Weak comparison: the validator covers the JSON, whatever the encoding.
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+async def json_response(request: Request, content: Any, cache_control: str, headers: Optional[dict] = None) -> Response:
+    if cache_control == IMMUTABLE and "authorization" in request.headers:
+        # A signed-in user's accounts can change under the same URL, so make
+        # the browser revalidate; the ETag keeps that a cheap 304.
+        cache_control = REVALIDATE
+    body = orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding, Authorization",
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if len(body) >= settings.INSIGHTS_COMPRESS_MIN_BYTES:
+        if brotli is not None and _accepts(request, "br"):
+            body = await run_in_threadpool(brotli.compress, body, quality=4)
+            headers["Content-Encoding"] = "br"
+        elif _accepts(request, "gzip"):
+            body = await run_in_threadpool(gzip.compress, body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,198 @@
+"""
+Google ID-token verification without a network round-trip per login.
+
+Tokens are checked locally against Google's signing keys (signature, aud,
+iss, exp). The keys are cached for as long as the certs response's
+Cache-Control max-age allows, and refreshes are single-flight. When
+GOOGLE_JWKS_FILE is set (which also needs GOOGLE_JWKS_TEST_MODE=true), keys
+come from that file instead. The tests/testdata keyset lets development and
+tests sign their own tokens:
+
+    GOOGLE_JWKS_TEST_MODE=true GOOGLE_JWKS_FILE=tests/testdata/google_jwks.json \\
+        python -m app.cli google-test-token user@example.com
+
+The remote tokeninfo endpoint is only used when the keys cannot be fetched.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Optional
+import httpx
+from jose import jwt, JWTError
+from app.config import settings
+from app.metrics import registry
+
+logger = logging.getLogger("app.auth.google")
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+TOKENINFO_URL = "https://www.googleapis.com/oauth2/v3/tokeninfo"
+TEST_KEY_FILE = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "tests", "testdata", "google_test_key.pem"))
+TEST_KEY_ID = "offline-test-key"
+
+google_verifications_total = registry.counter(
+    "google_token_verifications_total", "Google ID-token checks by method and result", ("method", "result")
+)
+
+class KeysUnavailable(Exception):
+    """The signing keys could not be fetched, so the token cannot be checked locally."""
+
+def _max_age(response: httpx.Response) -> Optional[float]:
+    match = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+    if not match:
+        return None
+    age = response.headers.get("age", "0")
+    return max(0.0, float(match.group(1)) - (float(age) if age.isdigit() else 0.0))
+
+class JWKSCache:
+    def __init__(self, url: str, path: Optional[str], default_ttl: float, min_refresh: float):
+        self.url = url
+        self.path = path
+        self.default_ttl = default_ttl
+        self.min_refresh = min_refresh
+        self._keys: Dict[str, dict] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._refresh: Optional[asyncio.Future] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=5.0)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+
+    async def _load(self):
+        if self.path:
+            with open(self.path) as f:
+                keys = json.load(f)["keys"]
+            ttl = float("inf")
+        else:
+            try:
+                response = await self.client.get(self.url)
+                response.raise_for_status()
+                keys = response.json()["keys"]
+            except (httpx.HTTPError, ValueError, KeyError) as exc:
+                raise KeysUnavailable(repr(exc)) from exc
+            ttl = _max_age(response)
+            ttl = self.default_ttl if ttl is None else ttl
+        now = time.monotonic()
+        self._keys = {key["kid"]: key for key in keys}
+        self._fetched_at = now
+        self._expires_at = now + ttl
+
+    async def _refresh_once(self):
+        # Concurrent logins that all find the cache stale share one fetch.
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._load())
+            self._refresh.add_done_callback(lambda _: setattr(self, "_refresh", None))
+        await asyncio.shield(self._refresh)
+
+    async def get(self, kid: str) -> Optional[dict]:
+        if time.monotonic() >= self._expires_at:
+            try:
+                await self._refresh_once()
+            except KeysUnavailable:
+                # Back off so every login does not wait out another failing fetch.
+                self._expires_at = time.monotonic() + self.min_refresh
+                if not self._keys:
+                    raise
+                # Google rotates slowly; keep verifying with the stale set.
+                logger.warning("Could not refresh Google signing keys; using cached keys")
+        elif not self._keys:
+            raise KeysUnavailable("Backing off after a failed fetch")
+        key = self._keys.get(kid)
+        # An unknown kid may mean Google rotated keys before our max-age ran
+        # out. Refetch, but not more than once per min_refresh seconds.
+        if key is None and time.monotonic() - self._fetched_at >= self.min_refresh:
+            await self._refresh_once()
+            key = self._keys.get(kid)
+        return key
+
+google_keys = JWKSCache(
+    url=settings.GOOGLE_JWKS_URL,
+    path=settings.GOOGLE_JWKS_FILE,
+    default_ttl=settings.GOOGLE_JWKS_DEFAULT_TTL,
+    min_refresh=settings.GOOGLE_JWKS_MIN_REFRESH,
+)
+
+async def verify_id_token(token: str) -> Optional[dict]:
+    """
+    Returns the token's claims when it is a valid Google ID token for this
+    app, None when it is not. Raises KeysUnavailable when that cannot be
+    decided locally.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError:
+        return None
+    if header.get("alg") != "RS256" or not header.get("kid"):
+        return None
+    key = await google_keys.get(header["kid"])
+    if key is None:
+        return None
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            audience=settings.GOOGLE_CLIENT_ID,
+            issuer=GOOGLE_ISSUERS,
+            options={"verify_at_hash": False},
+        )
+    except JWTError:
+        return None
+    if not claims.get("email"):
+        return None
+    return claims
+
+async def verify_remote(token: str) -> Optional[dict]:
+    response = await google_keys.client.get(TOKENINFO_URL, params={"id_token": token})
+    if response.status_code != 200:
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get("aud") != settings.GOOGLE_CLIENT_ID:
+        return None
+    return data
+
+async def get_google_user_info(token: str) -> Optional[dict]:
+    try:
+        claims = await verify_id_token(token)
+        google_verifications_total.inc(method="local", result="ok" if claims else "rejected")
+        return claims
+    except KeysUnavailable:
+        logger.warning("Google signing keys unavailable; falling back to tokeninfo")
+    try:
+        claims = await verify_remote(token)
+    except httpx.HTTPError:
+        google_verifications_total.inc(method="remote", result="error")
+        return None
+    google_verifications_total.inc(method="remote", result="ok" if claims else "rejected")
+    return claims
+
+def make_test_token(email: str, name: Optional[str] = None, expires_in: int = 3600, key_file: str = TEST_KEY_FILE) -> str:
+    """Signs an ID token with the offline test key; only verifiable with GOOGLE_JWKS_FILE pointing at tests/testdata."""
+    with open(key_file) as f:
+        private_key = f.read()
+    now = int(time.time())
+    claims = {
+        "iss": "https://accounts.google.com",
+        "aud": settings.GOOGLE_CLIENT_ID,
+        "sub": email,
+        "email": email,
+        "email_verified": True,
+        "name": name or email.split("@")[0],
+        "iat": now,
+        "exp": now + expires_in,
+    }
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": TEST_KEY_ID})
@@ -0,0 +1,108 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from app.config import settings
+from app.metrics import password_hash_seconds
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain: str, hashed: str) -> bool:
+    return pwd_context.verify(plain, hashed)
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated pool so a burst of logins cannot starve the
+    threadpool every other sync endpoint depends on. Once queue_limit calls are
+    waiting or running, new ones are rejected with a 503. Bulk batches keep at
+    most half the workers busy, so logins never queue behind a whole batch.
+    """
+
+    def __init__(self, kind: str, workers: int, queue_limit: int):
+        self.kind = kind
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.rejected = 0
+        self.bulk_workers = max(1, workers // 2)
+        self._executor: Optional[Executor] = None
+        self._bulk_slots: Optional[asyncio.Semaphore] = None
+        self._bulk_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _reserve(self):
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many login attempts in progress, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.start()
+        self.pending += 1
+
+    async def _run(self, op: str, fn, *args):
+        self._reserve()
+        try:
+            with password_hash_seconds.time(op=op):
+                return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    def _bulk_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._bulk_loop is not loop:
+            self._bulk_slots = asyncio.Semaphore(self.bulk_workers)
+            self._bulk_loop = loop
+        return self._bulk_slots
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """
+        Hashes a batch on at most bulk_workers workers; counts as one queued
+        call. Only bulk_workers jobs sit in the pool at a time, so a login
+        submitted mid-batch waits behind those, not the rest of the batch.
+        """
+        self._reserve()
+        try:
+            loop = asyncio.get_running_loop()
+            slots = self._bulk_semaphore()
+
+            async def hash_one(password: str) -> str:
+                async with slots:
+                    return await loop.run_in_executor(self._executor, hash_password, password)
+
+            with password_hash_seconds.time(op="hash_many"):
+                return await asyncio.gather(*[hash_one(password) for password in passwords])
+        finally:
+            self.pending -= 1
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self._run("verify", verify_password, plain, hashed)
+
+    def needs_update(self, hashed: str) -> bool:
+        return pwd_context.needs_update(hashed)
+
+password_hasher = PasswordHasher(
+    kind=settings.PASSWORD_HASH_EXECUTOR,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_limit=settings.PASSWORD_HASH_QUEUE_LIMIT,
+)
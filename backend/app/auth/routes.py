@@ -1,18 +1,33 @@
+import csv
+import io
 from datetime import timedelta
 import os
 import requests
 from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Cookie, Query
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from jose import JWTError, jwt
-from app.database import get_db
-from app.models import delete_user_by_email, get_user_by_email, create_user, User as DBUser
+from app.database import get_async_db
+from app.models import (
+    delete_user_by_email,
+    get_user_by_email,
+    create_user,
+    bulk_delete_users,
+    bulk_insert_users,
+    bulk_verify_users,
+    chunked,
+    user_cache,
+    User as DBUser,
+)
 from app.auth import utils
 from app.config import settings
+from app.auth.schemas import CurrentUser
 from app.auth.utils import create_access_token, get_current_user
+from app.auth.hashing import password_hasher
 
 router = APIRouter()
 SECRET = settings.JWT_SECRET
@@ -38,13 +53,16 @@ class LoginRequest(BaseModel):
 class GoogleLoginRequest(BaseModel):
     token: str
 
+class BulkEmailsRequest(BaseModel):
+    emails: List[str] = Field(..., min_length=1)
+
 @router.post("/register")
-def register(data: RegisterRequest, db: Session = Depends(get_db)):
-    user = get_user_by_email(db, data.email)
+async def register(data: RegisterRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await get_user_by_email(db, data.email)
     if user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_pw = utils.hash_password(data.password)
-    create_user(db, email=data.email, password=hashed_pw, is_google=False, name=data.name)
+    hashed_pw = await password_hasher.hash(data.password)
+    await create_user(db, email=data.email, password=hashed_pw, is_google=False, name=data.name)
     token = utils.create_email_verification_token(data.email)
     verify_link = f"{frontend_url}/verify-email?token={token}"
     utils.send_verification_email(data.email, token)
@@ -55,16 +73,18 @@ def register(data: RegisterRequest, db: Session = Depends(get_db)):
     }
 
 @router.get("/verify-email")
-def verify_email(token: str, db: Session = Depends(get_db)):
+async def verify_email(token: str, db: AsyncSession = Depends(get_async_db)):
     try:
         payload = jwt.decode(token, SECRET, algorithms=["HS256"])
-        user = get_user_by_email(db, payload["email"])
+        user = await get_user_by_email(db, payload["email"])
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         user.is_verified = True
-        db.commit()
-        access_token = utils.create_access_token(user.email)
-        refresh_token = utils.create_refresh_token(user.email, remember_me=True)
+        await db.commit()
+        user_cache.invalidate(user.email)
+        claims = utils.user_claims(user)
+        access_token = utils.create_access_token(user.email, claims)
+        refresh_token = utils.create_refresh_token(user.email, remember_me=True, claims=claims)
         response = JSONResponse(content={
             "message": "Email verified successfully",
             "redirect_url": "/dashboard",
@@ -84,8 +104,8 @@ def verify_email(token: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Invalid or expired token")
 
 @router.post("/resend-verification-email")
-def resend_verification_email(req: ResendEmailRequest, db: Session = Depends(get_db)):
-    user = get_user_by_email(db, req.email)
+async def resend_verification_email(req: ResendEmailRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await get_user_by_email(db, req.email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if user.is_verified:
@@ -95,16 +115,27 @@ def resend_verification_email(req: ResendEmailRequest, db: Session = Depends(get
     return {"message": "Verification email resent"}
 
 @router.post("/login")
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-    user = get_user_by_email(db, data.email)
+async def login(data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await get_user_by_email(db, data.email)
     if not user or not user.hashed_password:
         raise HTTPException(status_code=400, detail="Invalid credentials")
     if not user.is_verified:
         raise HTTPException(status_code=403, detail="Please verify your email to continue")
-    if not utils.verify_password(data.password, user.hashed_password):
+    if not await password_hasher.verify(data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid password")
-    access_token = utils.create_access_token(data.email)
-    refresh_token = utils.create_refresh_token(data.email, remember_me=data.remember_me)
+    if password_hasher.needs_update(user.hashed_password):
+        try:
+            new_hash = await password_hasher.hash(data.password)
+        except HTTPException:
+            # The pool is full. The password already checked out, so skip the
+            # upgrade; the next login will retry it.
+            new_hash = None
+        if new_hash:
+            user.hashed_password = new_hash
+            await db.commit()
+    claims = utils.user_claims(user)
+    access_token = utils.create_access_token(data.email, claims)
+    refresh_token = utils.create_refresh_token(data.email, remember_me=data.remember_me, claims=claims)
     response = JSONResponse(content={
         "message": "Login successful",
         "redirect_url": "/dashboard",
@@ -122,20 +153,25 @@ def login(data: LoginRequest, db: Session = Depends(get_db)):
     return response
 
 @router.post("/google-login")
-async def google_login(data: GoogleLoginRequest, db: Session = Depends(get_db)):
+async def google_login(data: GoogleLoginRequest, db: AsyncSession = Depends(get_async_db)):
     info = await utils.get_google_user_info(data.token)
     if not info:
         raise HTTPException(status_code=401, detail="Invalid Google token")
+    # tokeninfo returns the flag as a string, local verification as a bool.
+    if str(info.get("email_verified")).lower() != "true":
+        raise HTTPException(status_code=403, detail="Google account email is not verified")
     email = info["email"]
-    user = get_user_by_email(db, email)
+    user = await get_user_by_email(db, email)
     if not user:
-        create_user(db, email=email, password=None, is_google=True, name=info.get("name"))
+        user = await create_user(db, email=email, password=None, is_google=True, name=info.get("name"))
     if not user.is_verified:
         user.is_verified = True
-        db.commit()
-        db.refresh(user)
-    access_token = utils.create_access_token(email)
-    refresh_token = utils.create_refresh_token(email, remember_me=True)
+        await db.commit()
+        await db.refresh(user)
+        user_cache.invalidate(email)
+    claims = utils.user_claims(user)
+    access_token = utils.create_access_token(email, claims)
+    refresh_token = utils.create_refresh_token(email, remember_me=True, claims=claims)
     response = JSONResponse(content={
         "access_token": access_token,
         "message": "Login successful",
@@ -152,18 +188,31 @@ async def google_login(data: GoogleLoginRequest, db: Session = Depends(get_db)):
     )
     return response
 
+async def refreshed_access_token(payload: dict) -> str:
+    """
+    Mints an access token for a refresh token's user. The user is reloaded
+    so that deleting or unverifying an account stops refreshes, and embedded
+    claims come from the current row rather than the refresh token.
+    """
+    user = await utils.get_cached_user(payload["email"])
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    if not user.is_verified:
+        raise HTTPException(status_code=403, detail="Please verify your email to continue")
+    return utils.create_access_token(user.email, utils.user_claims(user))
+
 @router.post("/refresh-token")
-def refresh_token(request: Request):
+async def refresh_token(request: Request):
     token = request.cookies.get("refresh_token")
     if not token:
         raise HTTPException(status_code=401, detail="Refresh token missing")
     try:
         payload = jwt.decode(token, SECRET, algorithms=["HS256"])
-        email = payload.get("email")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
-    new_access_token = utils.create_access_token(email)
-    return {"access_token": new_access_token}
+    if not payload.get("email"):
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+    return {"access_token": await refreshed_access_token(payload)}
 
 @router.post("/refresh")
 async def refresh_token_endpoint(refresh_token: Optional[str] = Cookie(None)):
@@ -178,8 +227,7 @@ async def refresh_token_endpoint(refresh_token: Optional[str] = Cookie(None)):
     if not email:
         raise HTTPException(status_code=400, detail="Invalid token payload")
 
-    new_access_token = utils.create_access_token(email)
-    return JSONResponse(content={"access_token": new_access_token})
+    return JSONResponse(content={"access_token": await refreshed_access_token(payload)})
 
 
 @router.post("/logout")
@@ -194,25 +242,42 @@ def logout(response: Response):
     return {"message": "Logged out"}
 
 @router.get("/me")
-def get_me(user: DBUser = Depends(get_current_user)):
+async def get_me(user: CurrentUser = Depends(get_current_user)):
     return {"email": user.email, "name": user.name}
 
 @router.get("/all-users")
-def get_all_users(db: Session = Depends(get_db)):
-    users = db.query(DBUser).all()
-    return {"users": [{"email": u.email, "name": u.name} for u in users]}
+async def get_all_users(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[int] = Query(None, description="Last user id from the previous page"),
+    q: Optional[str] = Query(None, description="Email or name prefix"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    query = select(DBUser.id, DBUser.email, DBUser.name).order_by(DBUser.id).limit(limit + 1)
+    if cursor is not None:
+        query = query.where(DBUser.id > cursor)
+    if q:
+        query = query.where(or_(
+            DBUser.email.startswith(q, autoescape=True),
+            DBUser.name.startswith(q, autoescape=True),
+        ))
+    rows = (await db.execute(query)).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return {
+        "users": [{"email": row.email, "name": row.name} for row in rows[:limit]],
+        "next_cursor": next_cursor,
+    }
 
 @router.get("/dashboard")
-def protected_route(email: str = Depends(get_current_user)):
+async def protected_route(email: str = Depends(get_current_user)):
     return {"message": f"Welcome user {email}"}
 
 @router.delete("/delete-user")
-def delete_user(
+async def delete_user(
     email: str = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     response: Response = None
 ):
-    success = delete_user_by_email(db, email)
+    success = await delete_user_by_email(db, email)
     if not success:
         raise HTTPException(status_code=404, detail="User not found")
     response.delete_cookie(
@@ -224,8 +289,60 @@ def delete_user(
     )
     return {"message": f"User {email} deleted and refresh token removed"}
 
+@router.post("/bulk/delete", dependencies=[Depends(utils.require_admin)])
+async def bulk_delete(data: BulkEmailsRequest, db: AsyncSession = Depends(get_async_db)):
+    deleted = await bulk_delete_users(db, data.emails)
+    return {"requested": len(data.emails), "deleted": deleted}
+
+@router.post("/bulk/verify", dependencies=[Depends(utils.require_admin)])
+async def bulk_verify(data: BulkEmailsRequest, db: AsyncSession = Depends(get_async_db)):
+    verified = await bulk_verify_users(db, data.emails)
+    return {"requested": len(data.emails), "verified": verified}
+
+@router.post("/bulk/import", dependencies=[Depends(utils.require_admin)])
+async def bulk_import(
+    request: Request,
+    verified: bool = Query(False, description="Mark imported users as verified"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Imports users from a CSV request body with an email column and optional
+    name, password and verified columns. Existing emails are skipped.
+    """
+    body = (await request.body()).decode("utf-8-sig")
+    reader = csv.DictReader(io.StringIO(body))
+    if not reader.fieldnames or "email" not in reader.fieldnames:
+        raise HTTPException(status_code=400, detail="CSV must have a header row with an email column")
+
+    rows = {}
+    invalid = 0
+    for line in reader:
+        email = (line.get("email") or "").strip()
+        if "@" not in email:
+            invalid += 1
+            continue
+        rows.setdefault(email, line)
+
+    created = 0
+    for chunk in chunked(list(rows.items()), settings.BULK_CHUNK_SIZE):
+        passwords = [line.get("password") for _, line in chunk]
+        hashes = iter(await password_hasher.hash_many([p for p in passwords if p]))
+        users = [
+            {
+                "email": email,
+                "name": (line.get("name") or "").strip() or None,
+                "hashed_password": next(hashes) if password else None,
+                "is_google": False,
+                "is_verified": (line.get("verified") or "").strip().lower() in ("1", "true", "yes") or verified,
+            }
+            for (email, line), password in zip(chunk, passwords)
+        ]
+        created += await bulk_insert_users(db, users)
+
+    return {"rows": len(rows) + invalid, "created": created, "skipped": len(rows) - created, "invalid": invalid}
+
 @router.get("/protected")
-def get_facebook_ad_data(current_user: DBUser = Depends(utils.get_current_user)):
+def get_facebook_ad_data(current_user: CurrentUser = Depends(utils.get_current_user)):
     fb_access_token = "facebook_access_token"
     ad_account_id = "1234567890"
     url = f"https://graph.facebook.com/v19.0/{ad_account_id}/insights"
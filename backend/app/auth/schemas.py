@@ -1,4 +1,10 @@
+from typing import Optional
 from pydantic import BaseModel
 
 class User(BaseModel):
     email: str
+
+class CurrentUser(BaseModel):
+    email: str
+    name: Optional[str] = None
+    is_verified: bool = False
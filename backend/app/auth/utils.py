@@ -2,31 +2,23 @@ import os
 import uuid
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from passlib.context import CryptContext
 from typing import Optional
 from jose import jwt, JWTError
-import httpx
 from email.message import EmailMessage
 from fastapi import Request, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer
-from app.auth.schemas import User
+from app.auth.schemas import CurrentUser, User
+from app.auth.google import get_google_user_info
+from app.auth.hashing import hash_password, pwd_context, verify_password
 from app.config import settings
-from app.models import get_user_by_email
-from app.database import get_db 
-from sqlalchemy.orm import Session
+from app.models import get_user_by_email, user_cache
+from app.database import AsyncSessionLocal
 
 SECRET = settings.JWT_SECRET
 GOOGLE_CLIENT_ID = settings.GOOGLE_CLIENT_ID
 VERIFICATION_EXPIRY_HOURS = 1
 frontend_url = settings.FRONTEND_URL
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
 
 def create_email_verification_token(email: str):
     payload = {
@@ -45,13 +37,24 @@ def create_token(data: dict, expires_delta: timedelta) -> str:
     to_encode["jti"] = str(uuid.uuid4())
     return jwt.encode(to_encode, SECRET, algorithm="HS256")
 
-def create_access_token(email: str) -> str:
-    return create_token({"email": email}, timedelta(minutes=30))
+def user_claims(user) -> dict:
+    """Profile claims embedded in tokens when JWT_EMBED_USER_CLAIMS is on."""
+    if not settings.JWT_EMBED_USER_CLAIMS or user is None:
+        return {}
+    return {"name": user.name, "verified": bool(user.is_verified)}
+
+def claims_from_payload(payload: dict) -> dict:
+    if not settings.JWT_EMBED_USER_CLAIMS or "verified" not in payload:
+        return {}
+    return {"name": payload.get("name"), "verified": payload["verified"]}
 
-def create_refresh_token(email: str, remember_me: bool = False) -> str:
+def create_access_token(email: str, claims: Optional[dict] = None) -> str:
+    return create_token({"email": email, **(claims or {})}, timedelta(minutes=30))
+
+def create_refresh_token(email: str, remember_me: bool = False, claims: Optional[dict] = None) -> str:
     if remember_me:
-        return create_token({"email": email}, timedelta(days=90))
-    return create_token({"email": email}, timedelta(days=30))
+        return create_token({"email": email, **(claims or {})}, timedelta(days=90))
+    return create_token({"email": email, **(claims or {})}, timedelta(days=30))
 
 def decode_token(token: str) -> Optional[dict]:
     try:
@@ -60,30 +63,35 @@ def decode_token(token: str) -> Optional[dict]:
     except JWTError:
         return None
 
-async def get_google_user_info(token: str):
-    async with httpx.AsyncClient() as client:
-        res = await client.get(f"https://www.googleapis.com/oauth2/v3/tokeninfo?id_token={token}")
-        if res.status_code != 200:
-            return None
-        data = res.json()
-        if data.get("aud") != GOOGLE_CLIENT_ID:
+async def get_cached_user(email: str) -> Optional[CurrentUser]:
+    # The load is shared with concurrent callers, so it opens its own session
+    # rather than borrowing one that belongs to whichever request came first.
+    async def load():
+        async with AsyncSessionLocal() as db:
+            user = await get_user_by_email(db, email)
+        if not user:
             return None
-        return data
+        return CurrentUser(email=user.email, name=user.name, is_verified=bool(user.is_verified))
+    return await user_cache.get_or_load(email, load)
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET, algorithms=["HS256"])
-        email = payload.get("email")
-        if not email:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = get_user_by_email(db, email)
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    email = payload.get("email")
+    if not email:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    claims = claims_from_payload(payload)
+    if claims:
+        return CurrentUser(email=email, name=claims["name"], is_verified=claims["verified"])
+    user = await get_cached_user(email)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
 
-
+async def require_admin(user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+    """Signed-in, verified users listed in ADMIN_EMAILS."""
+    if not user.is_verified or user.email.lower() not in settings.ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
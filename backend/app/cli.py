@@ -0,0 +1,64 @@
+"""
+Operational commands, run from the backend directory:
+
+    python -m app.cli init-db      # create missing tables; run once per deploy
+    python -m app.cli boot-time    # measure worker import and startup time
+    python -m app.cli google-test-token user@example.com   # verify with GOOGLE_JWKS_TEST_MODE
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+def init_db_command(args):
+    from app.database import init_db
+
+    init_db()
+    print("Database schema is up to date")
+
+def boot_time_command(args):
+    # Each import runs in a fresh interpreter so nothing is already cached.
+    imports = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([
+            sys.executable, "-c",
+            "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)",
+        ])
+        imports.append(float(output.decode().split()[-1]))
+
+    from app.main import app
+
+    async def startup():
+        started = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            return time.perf_counter() - started
+
+    startup_seconds = asyncio.run(startup())
+    print(f"import  median {statistics.median(imports) * 1000:.0f} ms  max {max(imports) * 1000:.0f} ms  ({args.runs} runs)")
+    print(f"startup {startup_seconds * 1000:.0f} ms")
+
+def google_test_token_command(args):
+    from app.auth.google import make_test_token
+
+    print(make_test_token(args.email, args.name, args.expires_in, args.key))
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("init-db", help="Create any missing tables").set_defaults(func=init_db_command)
+    boot = commands.add_parser("boot-time", help="Measure worker import and startup time")
+    boot.add_argument("--runs", type=int, default=5)
+    boot.set_defaults(func=boot_time_command)
+    token = commands.add_parser("google-test-token", help="Sign a Google ID token with the offline test key")
+    token.add_argument("email")
+    token.add_argument("--name")
+    token.add_argument("--expires-in", type=int, default=3600)
+    token.add_argument("--key", default="tests/testdata/google_test_key.pem")
+    token.set_defaults(func=google_test_token_command)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,74 @@ class Settings:
         self.JWT_SECRET = os.getenv("JWT_SECRET")
         self.DATABASE_URL = os.getenv("DATABASE_URL")
         self.FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
+        self.GOOGLE_JWKS_URL = os.getenv("GOOGLE_JWKS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+        self.GOOGLE_JWKS_FILE = os.getenv("GOOGLE_JWKS_FILE")
+        self.GOOGLE_JWKS_TEST_MODE = os.getenv("GOOGLE_JWKS_TEST_MODE", "false").lower() == "true"
+        self.GOOGLE_JWKS_DEFAULT_TTL = float(os.getenv("GOOGLE_JWKS_DEFAULT_TTL", "3600"))
+        self.GOOGLE_JWKS_MIN_REFRESH = float(os.getenv("GOOGLE_JWKS_MIN_REFRESH", "60"))
+        self.DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+        self.DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+        self.DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        self.DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+        self.DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "false").lower() == "true"
+        self.DB_WARM_CONNECTIONS = int(os.getenv("DB_WARM_CONNECTIONS", "2"))
+        self.BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+        self.PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+        self.PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+        self.PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "64"))
+        self.USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+        self.USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+        self.JWT_EMBED_USER_CLAIMS = os.getenv("JWT_EMBED_USER_CLAIMS", "false").lower() == "true"
+        self.ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+        self.BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+        self.PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+        self.PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+        self.PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+        self.SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+        self.SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", "100"))
+        self.FB_ACCESS_TOKEN = os.getenv("FB_ACCESS_TOKEN")
+        self.FB_AD_ACCOUNT_ID = os.getenv("FB_AD_ACCOUNT_ID")
+        # Ad accounts users may add without a token of their own; they are read
+        # with FB_ACCESS_TOKEN. The FB_AD_ACCOUNT_ID account is always shared.
+        self.SHARED_AD_ACCOUNTS = {
+            account.strip().removeprefix("act_")
+            for account in [*os.getenv("SHARED_AD_ACCOUNTS", "").split(","), self.FB_AD_ACCOUNT_ID or ""]
+            if account.strip()
+        }
+        self.FB_GRAPH_URL = os.getenv("FB_GRAPH_URL", "https://graph.facebook.com/v23.0")
+        self.INSIGHTS_ATTRIBUTION_DAYS = int(os.getenv("INSIGHTS_ATTRIBUTION_DAYS", "3"))
+        self.INSIGHTS_REFRESH_SECONDS = int(os.getenv("INSIGHTS_REFRESH_SECONDS", "900"))
+        self.INSIGHTS_HISTORY_DAYS = int(os.getenv("INSIGHTS_HISTORY_DAYS", "1095"))
+        self.INSIGHTS_CACHE_TTL = float(os.getenv("INSIGHTS_CACHE_TTL", "60"))
+        self.INSIGHTS_CACHE_SIZE = int(os.getenv("INSIGHTS_CACHE_SIZE", "256"))
+        self.ACCOUNT_SYNC_CONCURRENCY = int(os.getenv("ACCOUNT_SYNC_CONCURRENCY", "2"))
+        self.ACCOUNT_SYNC_TIMEOUT = float(os.getenv("ACCOUNT_SYNC_TIMEOUT", "20"))
+        self.ACCOUNT_ACCESS_TTL = float(os.getenv("ACCOUNT_ACCESS_TTL", "300"))
+        self.INGEST_TOKEN = os.getenv("INGEST_TOKEN")
+        self.INGEST_WORKER = os.getenv("INGEST_WORKER", "true").lower() == "true"
+        self.INGEST_QUEUE_LIMIT = int(os.getenv("INGEST_QUEUE_LIMIT", "1000"))
+        self.INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))
+        self.INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "1"))
+        self.INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+        self.CUBE_CACHE_BYTES = int(os.getenv("CUBE_CACHE_BYTES", str(256 * 1024 * 1024)))
+        self.CUBE_TTL = float(os.getenv("CUBE_TTL", "300"))
+        self.STREAM_REFRESH_SECONDS = float(os.getenv("STREAM_REFRESH_SECONDS", "60"))
+        self.STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+        self.STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "16"))
+        self.STREAM_MAX_CONNECTIONS = int(os.getenv("STREAM_MAX_CONNECTIONS", "5000"))
+        self.INSIGHTS_COMPRESS_MIN_BYTES = int(os.getenv("INSIGHTS_COMPRESS_MIN_BYTES", "1024"))
+        self.INSIGHTS_PREWARM = os.getenv("INSIGHTS_PREWARM", "true").lower() == "true"
+        self.INSIGHTS_PREWARM_SECONDS = float(os.getenv("INSIGHTS_PREWARM_SECONDS", "600"))
+        self.INSIGHTS_PREWARM_JITTER = float(os.getenv("INSIGHTS_PREWARM_JITTER", "60"))
+        self.GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", "30"))
+        self.GRAPH_MAX_CONNECTIONS = int(os.getenv("GRAPH_MAX_CONNECTIONS", "20"))
+        self.GRAPH_CONCURRENCY = int(os.getenv("GRAPH_CONCURRENCY", "4"))
+        self.GRAPH_WINDOW_DAYS = int(os.getenv("GRAPH_WINDOW_DAYS", "7"))
+        self.GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "5"))
+        self.GRAPH_BACKOFF_BASE = float(os.getenv("GRAPH_BACKOFF_BASE", "1.0"))
+        self.GRAPH_USAGE_THRESHOLD = int(os.getenv("GRAPH_USAGE_THRESHOLD", "90"))
+        self.GRAPH_WARMUP = os.getenv("GRAPH_WARMUP", "false").lower() == "true"
         self._validate()
 
     def _validate(self):
@@ -25,5 +93,7 @@ class Settings:
         for name, value in required.items():
             if not value:
                 raise EnvironmentError(f"Missing required environment variable: {name}")
+        if self.GOOGLE_JWKS_FILE and (self.ENVIRONMENT == "production" or not self.GOOGLE_JWKS_TEST_MODE):
+            raise EnvironmentError("GOOGLE_JWKS_FILE is only accepted with GOOGLE_JWKS_TEST_MODE=true outside production")
 
 settings = Settings()
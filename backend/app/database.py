@@ -1,20 +1,83 @@
-import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
+import asyncio
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import settings
 
 DATABASE_URL = settings.DATABASE_URL
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set.")
 
-print(f"DATABASE_URL: {DATABASE_URL}")
+# Arbitrary key for the Postgres advisory lock that serialises init_db().
+SCHEMA_LOCK_KEY = 727_001
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_async_url(url: str) -> str:
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+def get_pool_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+ASYNC_DATABASE_URL = get_async_url(DATABASE_URL)
 Base = declarative_base()
 
+# Engines are created on first use so importing the app loads no DB driver
+# and opens nothing. ``engines`` maps a label to each sync Engine (the async
+# engine's ``sync_engine``) once it exists; hooks run as each one is created.
+engines: Dict[str, Engine] = {}
+_engine_hooks: List[Callable[[Engine, str], None]] = []
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+
+def on_engine_created(hook: Callable[[Engine, str], None]):
+    _engine_hooks.append(hook)
+    for label, engine in engines.items():
+        hook(engine, label)
+    return hook
+
+def _register(engine: Engine, label: str):
+    engines[label] = engine
+    for hook in _engine_hooks:
+        hook(engine, label)
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL, **get_pool_options(DATABASE_URL))
+        _register(_engine, "sync")
+    return _engine
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, **get_pool_options(ASYNC_DATABASE_URL))
+        _register(_async_engine.sync_engine, "async")
+    return _async_engine
+
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+_async_session_factory = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def SessionLocal() -> Session:
+    return _session_factory(bind=get_engine())
+
+def AsyncSessionLocal() -> AsyncSession:
+    return _async_session_factory(bind=get_async_engine())
+
 def get_db():
     db = SessionLocal()
     try:
@@ -22,5 +85,36 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def init_db():
+    """
+    Creates any missing tables. Run once per deploy (``python -m app.cli
+    init-db``) rather than from every worker; on Postgres an advisory lock
+    keeps concurrent callers from racing on the DDL.
+    """
+    import app.models  # noqa: F401 - registers every table on Base.metadata
+
+    with get_engine().begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        Base.metadata.create_all(bind=conn)
+
+async def warm_pool(size: int):
+    """Opens up to ``size`` async connections so the first requests skip the connect."""
+    engine = get_async_engine()
+    size = min(size, settings.DB_POOL_SIZE) if not ASYNC_DATABASE_URL.startswith("sqlite") else 1
+    connections = await asyncio.gather(*[engine.connect() for _ in range(size)])
+    for conn in connections:
+        await conn.execute(text("SELECT 1"))
+        await conn.close()
+
+async def dispose_engines():
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
+
 # psql -U postgres -d auth_db
- 
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+Resolves which ad accounts a request covers and syncs them all at once.
+
+Every read first checks that the account's token can still read it (cached
+for ACCOUNT_ACCESS_TTL), because stored rows are keyed by account alone and
+would otherwise be served to anyone who registers the account id. Accounts
+that pass are synced concurrently under a per-account semaphore and timeout,
+so one slow or failing account only costs its own freshness: its stored rows
+are still served and it is reported back as failed. When every sync fails,
+the stored rows are still served as long as the range has any.
+"""
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from app.cache import AsyncTTLCache
+from app.config import settings
+from app.database import SessionLocal
+from app.insights.graph import graph_client, is_access_error
+from app.insights.sync import has_synced_days, sync_range
+from app.metrics import registry
+from app.models import AdAccount, User
+
+logger = logging.getLogger("app.insights.accounts")
+
+account_sync_failures_total = registry.counter(
+    "insights_account_sync_failures_total", "Per-account syncs that failed or timed out", ("reason",)
+)
+
+class AccountRef(NamedTuple):
+    account_id: str
+    access_token: Optional[str]
+
+# (account_id, token fingerprint) -> whether that token can read the account.
+access_cache = AsyncTTLCache(maxsize=settings.INSIGHTS_CACHE_SIZE, ttl=settings.ACCOUNT_ACCESS_TTL)
+
+# account_id -> [semaphore, users]. Bounds concurrent syncs per ad account
+# across all requests in this worker; entries go away once nobody holds them.
+_semaphores: Dict[str, list] = {}
+
+def token_fingerprint(access_token: Optional[str]) -> str:
+    return hashlib.blake2b((access_token or "").encode(), digest_size=16).hexdigest()
+
+def default_accounts() -> List[AccountRef]:
+    if not settings.FB_AD_ACCOUNT_ID:
+        return []
+    return [AccountRef(settings.FB_AD_ACCOUNT_ID, settings.FB_ACCESS_TOKEN)]
+
+def accounts_for_user(db: Session, email: str) -> List[AccountRef]:
+    rows = (
+        db.query(AdAccount.account_id, AdAccount.access_token)
+        .join(User, User.id == AdAccount.user_id)
+        .filter(User.email == email)
+        .order_by(AdAccount.account_id)
+    )
+    accounts = []
+    for account_id, token in rows:
+        if token:
+            accounts.append(AccountRef(account_id, token))
+        elif account_id in settings.SHARED_AD_ACCOUNTS:
+            accounts.append(AccountRef(account_id, settings.FB_ACCESS_TOKEN))
+        # Token-less rows for accounts that are no longer shared are ignored.
+    return accounts
+
+def _shared(account: AccountRef) -> bool:
+    # Also true without any FB_ACCESS_TOKEN, so stored rows of the shared
+    # accounts are still served; their syncs fail on the missing token.
+    return account.access_token == settings.FB_ACCESS_TOKEN and account.account_id in settings.SHARED_AD_ACCOUNTS
+
+async def can_read(account: AccountRef) -> bool:
+    if _shared(account):
+        return True
+    if not account.access_token:
+        return False
+    return await access_cache.get_or_load(
+        (account.account_id, token_fingerprint(account.access_token)),
+        lambda: graph_client.can_read_account(account.account_id, account.access_token),
+    )
+
+async def readable_accounts(accounts: List[AccountRef]) -> Tuple[List[AccountRef], List[str]]:
+    """
+    Splits accounts into those whose token can read them and the ids of those
+    that cannot. An account whose check fails outright (Graph unreachable) is
+    treated as unreadable. Raises 403 when none are readable.
+    """
+    results = await asyncio.gather(*[can_read(account) for account in accounts], return_exceptions=True)
+    readable, denied = [], []
+    for account, result in zip(accounts, results):
+        if result is True:
+            readable.append(account)
+            continue
+        if isinstance(result, BaseException):
+            logger.warning("Access check for account %s failed: %r", account.account_id, result)
+        account_sync_failures_total.inc(reason="denied")
+        denied.append(account.account_id)
+    if accounts and not readable:
+        raise HTTPException(status_code=403, detail="The access token cannot read this ad account")
+    return readable, denied
+
+@asynccontextmanager
+async def _account_slot(account_id: str):
+    entry = _semaphores.get(account_id)
+    if entry is None:
+        entry = _semaphores[account_id] = [asyncio.Semaphore(settings.ACCOUNT_SYNC_CONCURRENCY), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1] and _semaphores.get(account_id) is entry:
+            del _semaphores[account_id]
+
+def _has_stored_rows(account_ids: List[str], since: date, until: date) -> bool:
+    db = SessionLocal()
+    try:
+        return has_synced_days(db, account_ids, since, until)
+    finally:
+        db.close()
+
+async def _sync_account(account: AccountRef, since: date, until: date):
+    async with _account_slot(account.account_id):
+        await sync_range(since, until, account_id=account.account_id, access_token=account.access_token)
+
+async def sync_accounts(accounts: List[AccountRef], since: date, until: date) -> Tuple[List[str], List[str]]:
+    """
+    Syncs the range for every readable account concurrently. Returns the ids
+    whose rows may be served and the ids that were denied, failed or timed
+    out. Waiting for an account's semaphore counts towards its timeout. A
+    timed-out sync keeps running in the background (sync_range shields it)
+    and lands for the next request. The first error is raised only when
+    every readable account failed and none has anything stored for the range.
+    """
+    readable, failed = await readable_accounts(accounts)
+    results = await asyncio.gather(
+        *[
+            asyncio.wait_for(_sync_account(account, since, until), timeout=settings.ACCOUNT_SYNC_TIMEOUT)
+            for account in readable
+        ],
+        return_exceptions=True,
+    )
+    served, errors = [], []
+    for account, result in zip(readable, results):
+        if not isinstance(result, BaseException):
+            served.append(account.account_id)
+            continue
+        if isinstance(result, HTTPException) and is_access_error(result):
+            # The token lost access since it was last checked.
+            access_cache.invalidate((account.account_id, token_fingerprint(account.access_token)))
+            reason = "denied"
+        else:
+            served.append(account.account_id)
+            errors.append(result)
+            reason = "timeout" if isinstance(result, asyncio.TimeoutError) else "error"
+        account_sync_failures_total.inc(reason=reason)
+        logger.warning("Insights sync for account %s failed: %r", account.account_id, result)
+        failed.append(account.account_id)
+    if not served:
+        raise HTTPException(status_code=403, detail="The access token cannot read this ad account")
+    if errors and len(errors) == len(served) and not await asyncio.to_thread(_has_stored_rows, served, since, until):
+        error = errors[0]
+        if isinstance(error, asyncio.TimeoutError):
+            raise HTTPException(status_code=504, detail="Timed out syncing insights from Facebook")
+        raise error
+    return served, failed
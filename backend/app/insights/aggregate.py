@@ -0,0 +1,23 @@
+from sqlalchemy import Date, cast, func, literal_column
+from sqlalchemy.orm import Session
+from app.models import InsightDaily
+
+DIMENSIONS = {
+    "campaign": InsightDaily.campaign,
+    "publisher_platform": InsightDaily.publisher_platform,
+}
+BUCKETS = {"day", "week", "month"}
+
+def bucket_expression(db: Session, bucket: str, column=InsightDaily.date):
+    """
+    SQL expression for the start of the day/week/month a row falls in.
+    Weeks start on Monday, matching Postgres' date_trunc.
+    """
+    if bucket == "day":
+        return column
+    if db.get_bind().dialect.name == "sqlite":
+        if bucket == "week":
+            return func.date(column, "-6 days", "weekday 1")
+        return func.date(column, "start of month")
+    # Inlined rather than bound so the SELECT and GROUP BY expressions match.
+    return cast(func.date_trunc(literal_column(f"'{bucket}'"), column), Date)
@@ -0,0 +1,288 @@
+"""
+Array-backed insights cube.
+
+A cube holds every (date, campaign, platform) row for a set of accounts and
+a date range. The three dimensions are dictionary-encoded: sorted value
+lists plus int32 code columns. The metrics are NumPy columns, so filters,
+regroups and top-k run as vectorized operations instead of loops over
+Python rows.
+
+Cubes are cached per (accounts, since, until) in an LRU bounded by
+CUBE_CACHE_BYTES. They are dropped when a sync or ingest writes to one of
+their accounts, or after CUBE_TTL seconds for changes made by other workers.
+Concurrent misses for the same key wait for one build instead of each
+scanning the store.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import InsightDaily
+
+DIMENSIONS = ("date", "campaign", "publisher_platform")
+METRICS = ("clicks", "impressions", "spend", "cpc", "ctr")
+# The sum a ratio divides by; the ratio is undefined where it is zero.
+RATIO_DENOMINATORS = {"cpc": "clicks", "ctr": "impressions"}
+
+def _ratios(clicks: np.ndarray, impressions: np.ndarray, spend: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cpc = np.where(clicks > 0, spend / clicks, 0.0)
+        ctr = np.where(impressions > 0, clicks * 100.0 / impressions, 0.0)
+    return cpc, ctr
+
+def _bucket_starts(days: np.ndarray, bucket: str) -> np.ndarray:
+    if bucket == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    if bucket == "week":
+        # 1970-01-01 was a Thursday; shift so weeks start on Monday.
+        return days - ((days.astype("int64") + 3) % 7).astype("timedelta64[D]")
+    return days
+
+class InsightsCube:
+    def __init__(self, codes: Dict[str, np.ndarray], values: Dict[str, List], metrics: Dict[str, np.ndarray]):
+        self.codes = codes
+        self.values = values
+        self.metrics = metrics
+
+    @classmethod
+    def build(cls, db: Session, account_ids: List[str], since: date, until: date) -> "InsightsCube":
+        """
+        Loads the range with rows from different accounts merged per
+        (date, campaign, platform), and cpc/ctr recomputed from the sums.
+        """
+        keys = (InsightDaily.date, InsightDaily.campaign, InsightDaily.publisher_platform)
+        rows = (
+            db.query(
+                *keys,
+                func.coalesce(func.sum(InsightDaily.clicks), 0),
+                func.coalesce(func.sum(InsightDaily.impressions), 0),
+                func.coalesce(func.sum(InsightDaily.spend), 0.0),
+            )
+            .filter(
+                InsightDaily.account_id.in_(account_ids),
+                InsightDaily.date >= since,
+                InsightDaily.date <= until,
+            )
+            .group_by(*keys)
+            .order_by(*keys)
+            .all()
+        )
+        columns = list(zip(*rows)) or [()] * 6
+        codes, values = {}, {}
+        dates = np.array(columns[0], dtype="datetime64[D]")
+        values["date"], codes["date"] = np.unique(dates, return_inverse=True)
+        for name, column in zip(DIMENSIONS[1:], columns[1:3]):
+            uniques, inverse = np.unique(np.array(column, dtype=object).astype(str), return_inverse=True)
+            values[name], codes[name] = uniques.tolist(), inverse
+        codes = {name: code.astype(np.int32) for name, code in codes.items()}
+        clicks = np.array(columns[3], dtype=np.int64)
+        impressions = np.array(columns[4], dtype=np.int64)
+        spend = np.array(columns[5], dtype=np.float64)
+        cpc, ctr = _ratios(clicks, impressions, spend)
+        return cls(codes, values, {"clicks": clicks, "impressions": impressions, "spend": spend, "cpc": cpc, "ctr": ctr})
+
+    def __len__(self) -> int:
+        return len(self.metrics["clicks"])
+
+    @property
+    def nbytes(self) -> int:
+        arrays = sum(a.nbytes for a in self.codes.values()) + sum(a.nbytes for a in self.metrics.values())
+        labels = sum(len(v) for name in ("campaign", "publisher_platform") for v in self.values[name])
+        return arrays + self.values["date"].nbytes + labels
+
+    def date_labels(self) -> List[str]:
+        return self.values["date"].astype(str).tolist()
+
+    def decode(self, name: str) -> np.ndarray:
+        """The dimension's value for every row, as an object array."""
+        labels = self.date_labels() if name == "date" else self.values[name]
+        return np.array(labels, dtype=object)[self.codes[name]]
+
+    def mask(
+        self,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        campaigns: Optional[Iterable[str]] = None,
+        platforms: Optional[Iterable[str]] = None,
+    ) -> np.ndarray:
+        """Boolean row mask for a date sub-range and/or sets of campaigns and platforms."""
+        keep = np.ones(len(self), dtype=bool)
+        days = self.values["date"][self.codes["date"]]
+        if since is not None:
+            keep &= days >= np.datetime64(since, "D")
+        if until is not None:
+            keep &= days <= np.datetime64(until, "D")
+        for name, wanted in (("campaign", campaigns), ("publisher_platform", platforms)):
+            if wanted is not None:
+                allowed = np.isin(np.array(self.values[name], dtype=object), list(wanted))
+                keep &= allowed[self.codes[name]]
+        return keep
+
+    def group_sum(
+        self,
+        dimensions: List[str],
+        bucket: Optional[str] = None,
+        mask: Optional[np.ndarray] = None,
+    ) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """
+        Sums clicks, impressions and spend per combination of the given
+        dimensions (and date bucket), in sorted key order. Returns the label
+        columns and the metric columns, with cpc/ctr recomputed from the sums.
+        """
+        group_codes, group_labels = [], []
+        for name in dimensions:
+            group_codes.append(self.codes[name])
+            group_labels.append(np.array(self.values[name], dtype=object))
+        if bucket:
+            starts = _bucket_starts(self.values["date"], bucket)
+            bucket_values, bucket_of_date = np.unique(starts, return_inverse=True)
+            group_codes.append(bucket_of_date[self.codes["date"]])
+            group_labels.append(bucket_values.astype(str).astype(object))
+
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+        if not group_codes:
+            sums = {name: np.array([self.metrics[name][rows].sum()]) for name in ("clicks", "impressions", "spend")}
+            sums["cpc"], sums["ctr"] = _ratios(sums["clicks"], sums["impressions"], sums["spend"])
+            return {}, sums
+
+        shape = tuple(len(labels) for labels in group_labels)
+        flat = np.ravel_multi_index(tuple(codes[rows] for codes in group_codes), shape) if len(rows) else np.empty(0, dtype=np.int64)
+        groups, inverse = np.unique(flat, return_inverse=True)
+        sums = {
+            name: np.bincount(inverse, weights=self.metrics[name][rows], minlength=len(groups))
+            for name in ("clicks", "impressions", "spend")
+        }
+        sums["clicks"] = sums["clicks"].astype(np.int64)
+        sums["impressions"] = sums["impressions"].astype(np.int64)
+        sums["spend"] = sums["spend"].astype(np.float64)
+        sums["cpc"], sums["ctr"] = _ratios(sums["clicks"], sums["impressions"], sums["spend"])
+        indexes = np.unravel_index(groups, shape) if len(groups) else [np.empty(0, dtype=np.int64)] * len(shape)
+        names = list(dimensions) + (["period"] if bucket else [])
+        labels = {name: group_labels[i][indexes[i]] for i, name in enumerate(names)}
+        return labels, sums
+
+    def top_k(
+        self,
+        dimension: str,
+        metric: str,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        min_impressions: int = 0,
+        ascending: bool = False,
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        The k groups of ``dimension`` with the highest (or lowest) ``metric``.
+        Groups without clicks have no cpc and groups without impressions have
+        no ctr, so they are left out when ranking by those ratios.
+        """
+        labels, sums = self.group_sum([dimension], mask=mask)
+        keep = sums["impressions"] >= min_impressions
+        if metric in RATIO_DENOMINATORS:
+            keep &= sums[RATIO_DENOMINATORS[metric]] > 0
+        # Groups come back in label order, so a position doubles as the tie-breaker.
+        eligible = np.flatnonzero(keep)
+        scores = sums[metric][eligible]
+        if not ascending:
+            scores = -scores
+        if len(eligible) > k:
+            # Partitioning finds the k-th best score in linear time. Everything
+            # better is in; ties at that score are taken in label order.
+            kth = np.partition(scores, k - 1)[k - 1]
+            better = np.flatnonzero(scores < kth)
+            tied = np.flatnonzero(scores == kth)[:k - len(better)]
+            best = np.sort(np.concatenate([better, tied]))
+            eligible, scores = eligible[best], scores[best]
+        order = eligible[np.lexsort((eligible, scores))]
+        return labels[dimension][order], {name: values[order] for name, values in sums.items()}
+
+class CubeCache:
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, Tuple[float, InsightsCube]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._building: Dict[tuple, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _drop(self, key):
+        _, cube = self._entries.pop(key)
+        self._bytes -= cube.nbytes
+
+    def get(self, db: Session, account_ids: List[str], since: date, until: date) -> InsightsCube:
+        key = (tuple(sorted(account_ids)), since, until)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                self._drop(key)
+            building = self._building.get(key)
+            owner = building is None
+            if owner:
+                building = self._building[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            return building.result()
+        try:
+            cube = InsightsCube.build(db, account_ids, since, until)
+        except BaseException as exc:
+            with self._lock:
+                if self._building.get(key) is building:
+                    del self._building[key]
+            building.set_exception(exc)
+            raise
+        with self._lock:
+            # Not cached if an invalidation landed while it was being built.
+            if self._building.get(key) is building:
+                del self._building[key]
+                if key in self._entries:
+                    self._drop(key)
+                if cube.nbytes <= self.max_bytes:
+                    self._entries[key] = (time.monotonic(), cube)
+                    self._bytes += cube.nbytes
+                    while self._bytes > self.max_bytes:
+                        self._drop(next(iter(self._entries)))
+        building.set_result(cube)
+        return cube
+
+    def invalidate_account(self, account_id: str):
+        with self._lock:
+            for key in [key for key in self._entries if account_id in key[0]]:
+                self._drop(key)
+            # Builds already running may predate the write; later lookups start afresh.
+            for key in [key for key in self._building if account_id in key[0]]:
+                del self._building[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._building.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._building),
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+cube_cache = CubeCache(settings.CUBE_CACHE_BYTES, settings.CUBE_TTL)
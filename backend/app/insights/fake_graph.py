@@ -0,0 +1,159 @@
+"""
+A small stand-in for the Graph API insights endpoint, used by tests and for
+local development without a Facebook token.
+
+Mount it in-process with ``httpx.ASGITransport(app=FakeGraph().app)`` or serve it
+with ``uvicorn app.insights.fake_graph:app --port 8001`` and point
+``FB_GRAPH_URL`` at ``http://localhost:8001/v23.0``.
+"""
+import base64
+import json
+import random
+from datetime import date, timedelta
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+from typing import List, Optional
+
+PLATFORMS = ["facebook", "instagram", "audience_network", "messenger"]
+
+def _encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+def _decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+class FakeGraph:
+    def __init__(
+        self,
+        campaigns: int = 5,
+        ads_per_campaign: int = 3,
+        start: date = date(2024, 1, 1),
+        access_token: str = "tok",
+        throttle_every: int = 0,
+        accounts: Optional[List[str]] = None,
+    ):
+        self.campaigns = [f"Campaign {i + 1}" for i in range(campaigns)]
+        self.ads_per_campaign = ads_per_campaign
+        self.start = start
+        self.access_token = access_token
+        self.throttle_every = throttle_every
+        # Ad accounts the token can read; None means any.
+        self.accounts = accounts
+        self.calls: List[dict] = []
+        self.app = self._build_app()
+
+    def _values(self, *key) -> dict:
+        rng = random.Random("|".join(str(k) for k in key))
+        impressions = rng.randint(100, 5000)
+        clicks = rng.randint(0, impressions // 10)
+        spend = round(clicks * rng.uniform(0.1, 2.0), 2)
+        return {
+            "clicks": clicks,
+            "impressions": impressions,
+            "spend": spend,
+        }
+
+    def _row(self, day: date, campaign: str, platform: str, ad: Optional[str], daily: bool) -> dict:
+        if daily:
+            values = self._values(day, campaign, platform, ad)
+        else:
+            values = {"clicks": 0, "impressions": 0, "spend": 0.0}
+            current = self.start
+            while current <= day:
+                for k, v in self._values(current, campaign, platform, ad).items():
+                    values[k] += v
+                current += timedelta(days=1)
+        clicks, impressions, spend = values["clicks"], values["impressions"], values["spend"]
+        row = {
+            "date_start": day.isoformat() if daily else self.start.isoformat(),
+            "date_stop": day.isoformat(),
+            "campaign_name": campaign,
+            "clicks": str(clicks),
+            "impressions": str(impressions),
+            "spend": f"{spend:.2f}",
+            "cpc": f"{spend / clicks:.6f}" if clicks else "0",
+            "ctr": f"{clicks / impressions * 100:.6f}" if impressions else "0",
+        }
+        if ad:
+            row["ad_name"] = ad
+        if platform:
+            row["publisher_platform"] = platform
+        return row
+
+    def rows(self, since: date, until: date, level: str, breakdowns: Optional[str], daily: bool) -> List[dict]:
+        platforms = PLATFORMS if breakdowns == "publisher_platform" else [None]
+        ads = [None]
+        if level == "ad":
+            ads = [f"Ad {i + 1}" for i in range(self.ads_per_campaign)]
+        days = []
+        if daily:
+            day = since
+            while day <= until:
+                days.append(day)
+                day += timedelta(days=1)
+        else:
+            days = [until]
+        return [
+            self._row(day, campaign, platform, ad and f"{campaign} / {ad}", daily)
+            for day in days
+            for campaign in self.campaigns
+            for platform in platforms
+            for ad in ads
+        ]
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        def denied(access_token: str, account_id: str) -> Optional[JSONResponse]:
+            if access_token != self.access_token:
+                return JSONResponse(status_code=400, content={"error": {"message": "Invalid OAuth access token", "code": 190}})
+            if self.accounts is not None and account_id not in self.accounts:
+                return JSONResponse(status_code=403, content={"error": {"message": "Missing permissions", "code": 200}})
+            return None
+
+        @app.get("/{version}/act_{account_id}")
+        def ad_account(version: str, account_id: str, access_token: str = Query(...), fields: Optional[str] = None):
+            return denied(access_token, account_id) or {"id": f"act_{account_id}"}
+
+        @app.get("/{version}/act_{account_id}/insights")
+        def insights(
+            version: str,
+            account_id: str,
+            access_token: str = Query(...),
+            level: str = "account",
+            breakdowns: Optional[str] = None,
+            time_range: Optional[str] = None,
+            time_increment: Optional[str] = None,
+            date_preset: Optional[str] = None,
+            limit: int = 25,
+            after: Optional[str] = None,
+            fields: Optional[str] = None,
+        ):
+            self.calls.append({"account_id": account_id, "time_range": time_range, "level": level, "after": after})
+            error = denied(access_token, account_id)
+            if error is not None:
+                return error
+            if self.throttle_every and len(self.calls) % self.throttle_every == 0:
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": {"message": "User request limit reached", "code": 17}},
+                    headers={"retry-after": "0"},
+                )
+            if time_range:
+                span = json.loads(time_range)
+                since, until = date.fromisoformat(span["since"]), date.fromisoformat(span["until"])
+            else:
+                since, until = self.start, date.today()
+            rows = self.rows(since, until, level, breakdowns, daily=time_increment == "1")
+            offset = _decode_cursor(after)
+            page = rows[offset:offset + limit]
+            paging = {"cursors": {"before": _encode_cursor(offset), "after": _encode_cursor(offset + len(page))}}
+            if offset + limit < len(rows):
+                paging["next"] = f"/{version}/act_{account_id}/insights?after={paging['cursors']['after']}"
+            return {"data": page, "paging": paging}
+
+        return app
+
+app = FakeGraph().app
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import random
+from datetime import date, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+import httpx
+from fastapi import HTTPException
+from app.config import settings
+from app.metrics import graph_pages_per_fetch, graph_request_seconds, graph_requests_total
+
+DAILY_FIELDS = "date_start,campaign_name,clicks,impressions,cpc,ctr,spend"
+AD_FIELDS = "date_start,campaign_name,ad_name,clicks,impressions,cpc,ctr"
+
+# Graph error codes that mean "slow down" rather than "this request is wrong".
+# https://developers.facebook.com/docs/graph-api/overview/rate-limiting
+RATE_LIMIT_CODES = {4, 17, 32, 613} | set(range(80000, 80015))
+
+def insights_url(account_id: str) -> str:
+    return f"{settings.FB_GRAPH_URL}/act_{account_id}/insights"
+
+def parse_row(item: dict) -> dict:
+    return {
+        "date": date.fromisoformat(item["date_start"]),
+        "campaign": item.get("campaign_name") or "unknown",
+        "publisher_platform": item.get("publisher_platform", "unknown"),
+        "clicks": int(item.get("clicks", 0)),
+        "impressions": int(item.get("impressions", 0)),
+        "cpc": float(item.get("cpc", 0)),
+        "ctr": float(item.get("ctr", 0)),
+        "spend": float(item.get("spend", 0)),
+    }
+
+def split_windows(since: date, until: date, days: int) -> List[Tuple[date, date]]:
+    windows = []
+    start = since
+    while start <= until:
+        end = min(start + timedelta(days=days - 1), until)
+        windows.append((start, end))
+        start = end + timedelta(days=1)
+    return windows
+
+def is_access_error(error: HTTPException) -> bool:
+    """A Graph 4xx about the token or its permissions, as opposed to throttling."""
+    if not 400 <= error.status_code < 500 or error.status_code == 429:
+        return False
+    detail = error.detail if isinstance(error.detail, dict) else {}
+    return detail.get("error", {}).get("code") not in RATE_LIMIT_CODES
+
+def _error_code(response: httpx.Response) -> Optional[int]:
+    try:
+        return response.json().get("error", {}).get("code")
+    except (ValueError, AttributeError):
+        return None
+
+def _error_detail(response: httpx.Response):
+    # Gateways in front of Graph can answer with HTML rather than JSON.
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
+
+# The utilisation fields of x-app-usage and x-ad-account-usage, in percent.
+# The same headers also carry durations and tiers that are not percentages.
+USAGE_FIELDS = {"call_count", "total_time", "total_cputime"}
+
+def _usage_percent(response: httpx.Response) -> int:
+    # x-app-usage / x-ad-account-usage report how close we are to throttling.
+    usage = 0
+    for header in ("x-app-usage", "x-ad-account-usage"):
+        raw = response.headers.get(header)
+        if not raw:
+            continue
+        try:
+            values = json.loads(raw)
+        except ValueError:
+            continue
+        if not isinstance(values, dict):
+            continue
+        usage = max([usage] + [
+            value for key, value in values.items()
+            if (key in USAGE_FIELDS or key.endswith("_util_pct")) and isinstance(value, (int, float))
+        ])
+    return int(usage)
+
+def _insights_params(access_token: str, fields: str, level: str, breakdowns: Optional[str]) -> dict:
+    params = {
+        "fields": fields,
+        "time_increment": "1",
+        "level": level,
+        "access_token": access_token,
+        "limit": 1000,
+    }
+    if breakdowns:
+        params["breakdowns"] = breakdowns
+    return params
+
+def _with_time_range(params: dict, since: date, until: date) -> dict:
+    return {**params, "time_range": json.dumps({"since": since.isoformat(), "until": until.isoformat()})}
+
+class GraphClient:
+    """
+    Shared Graph API client. Owns one pooled ``httpx.AsyncClient`` for the life
+    of the process, fans date ranges out into windows fetched with bounded
+    concurrency, follows every page and backs off when Graph rate limits us.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pause_until = 0.0
+
+    def start(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            timeout=settings.GRAPH_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.GRAPH_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GRAPH_MAX_CONNECTIONS,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(settings.GRAPH_CONCURRENCY)
+
+    async def warm_up(self, timeout: float = 2.0):
+        """
+        Opens a keep-alive connection to the Graph host so the first dashboard
+        request skips DNS and the TLS handshake. Best effort: any response,
+        even an auth error, leaves a pooled connection behind.
+        """
+        try:
+            await self.client.head(settings.FB_GRAPH_URL, timeout=timeout)
+        except httpx.HTTPError:
+            pass
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._semaphore = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # The app starts the client in its lifespan hook; scripts and the
+        # sync CLI get one lazily on first use.
+        self.start()
+        return self._client
+
+    async def _throttle(self):
+        delay = self._pause_until - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, params: dict) -> dict:
+        attempt = 0
+        while True:
+            await self._throttle()
+            with graph_request_seconds.time():
+                response = await self.client.get(url, params=params)
+            graph_requests_total.inc(status=response.status_code)
+            loop_time = asyncio.get_running_loop().time()
+            if response.status_code == 200:
+                if _usage_percent(response) >= settings.GRAPH_USAGE_THRESHOLD:
+                    self._pause_until = max(self._pause_until, loop_time + settings.GRAPH_BACKOFF_BASE)
+                return response.json()
+
+            rate_limited = response.status_code == 429 or _error_code(response) in RATE_LIMIT_CODES
+            if not (rate_limited or response.status_code >= 500) or attempt >= settings.GRAPH_MAX_RETRIES:
+                raise HTTPException(status_code=response.status_code, detail=_error_detail(response))
+
+            retry_after = response.headers.get("retry-after")
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = settings.GRAPH_BACKOFF_BASE * (2 ** attempt) * (1 + random.random())
+            if rate_limited:
+                # Every window shares the same quota, so pause them all.
+                self._pause_until = max(self._pause_until, loop_time + delay)
+            else:
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    async def iter_pages(self, url: str, params: dict) -> AsyncIterator[List[dict]]:
+        params = dict(params)
+        pages = 0
+        try:
+            while True:
+                json_data = await self.get(url, params)
+                pages += 1
+                yield json_data.get("data", [])
+                paging = json_data.get("paging", {})
+                after_cursor = paging.get("cursors", {}).get("after")
+                if not after_cursor or not paging.get("next"):
+                    break
+                params["after"] = after_cursor
+        finally:
+            if pages:
+                graph_pages_per_fetch.observe(pages)
+
+    async def fetch_all(self, url: str, params: dict) -> List[dict]:
+        self.start()
+        async with self._semaphore:
+            rows = []
+            async for page in self.iter_pages(url, params):
+                rows.extend(page)
+            return rows
+
+    async def can_read_account(self, account_id: str, access_token: str) -> bool:
+        """
+        Whether the token can read the ad account. Throttling and server
+        errors are raised rather than reported as a denial.
+        """
+        try:
+            await self.get(f"{settings.FB_GRAPH_URL}/act_{account_id}", {"fields": "id", "access_token": access_token})
+        except HTTPException as error:
+            if is_access_error(error):
+                return False
+            raise
+        return True
+
+    async def fetch_insights(
+        self,
+        account_id: str,
+        access_token: str,
+        since: date,
+        until: date,
+        fields: str = DAILY_FIELDS,
+        level: str = "campaign",
+        breakdowns: Optional[str] = "publisher_platform",
+    ) -> List[dict]:
+        """
+        Fetches daily insights for the range, split into windows of
+        GRAPH_WINDOW_DAYS that are fetched in parallel. Rows come back in
+        window order.
+        """
+        params = _insights_params(access_token, fields, level, breakdowns)
+        windows = split_windows(since, until, settings.GRAPH_WINDOW_DAYS)
+        pages = await asyncio.gather(*[
+            self.fetch_all(insights_url(account_id), _with_time_range(params, start, end))
+            for start, end in windows
+        ])
+        return [item for page in pages for item in page]
+
+    async def iter_insights(
+        self,
+        account_id: str,
+        access_token: str,
+        since: date,
+        until: date,
+        fields: str = AD_FIELDS,
+        level: str = "ad",
+        breakdowns: Optional[str] = "publisher_platform",
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Yields insights one Graph page at a time, walking the windows in
+        order, so callers can stream arbitrarily long ranges.
+        """
+        params = _insights_params(access_token, fields, level, breakdowns)
+        for start, end in split_windows(since, until, settings.GRAPH_WINDOW_DAYS):
+            async for page in self.iter_pages(insights_url(account_id), _with_time_range(params, start, end)):
+                yield page
+
+graph_client = GraphClient()
+
+async def fetch_daily_insights(
+    account_id: str,
+    access_token: str,
+    since: date,
+    until: date,
+    graph: Optional[GraphClient] = None,
+) -> List[dict]:
+    graph = graph or graph_client
+    items = await graph.fetch_insights(account_id, access_token, since, until)
+    return [parse_row(item) for item in items]
@@ -0,0 +1,316 @@
+"""
+Durable ingestion queue for pushed insight rows.
+
+Producers (the /api/ingest/insights webhook, or a sync job via the CLI)
+append raw Graph rows to the ingest_queue table and return immediately. A
+background worker (started when INGEST_TOKEN is set) claims batches oldest
+first, coerces them in one pass and upserts them in INGEST_CHUNK_SIZE chunks
+within one transaction, so these writes never run inside a dashboard
+request. Rows for closed days (see first_open_day) are refused: responses
+covering those days are cached as immutable. Any worker can claim a batch; the claim is a
+conditional UPDATE, so each batch is processed once.
+
+    python -m app.insights.ingest enqueue --account 123 rows.json
+    python -m app.insights.ingest drain
+    python -m app.insights.ingest replay --failed --stale-minutes 10
+    python -m app.insights.ingest replay --ids 41,42
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal, init_db
+from app.insights.cube import cube_cache
+from app.insights.rollups import refresh_rollups
+from app.insights.sync import first_open_day, merge_rows
+from app.metrics import Gauge, registry
+from app.models import IngestBatch, InsightDaily, InsightSyncState, chunked
+
+logger = logging.getLogger("app.insights.ingest")
+
+PENDING, PROCESSING, DONE, FAILED = "pending", "processing", "done", "failed"
+KEY_COLUMNS = ["account_id", "date", "campaign", "publisher_platform"]
+VALUE_COLUMNS = ["clicks", "impressions", "cpc", "ctr", "spend"]
+
+ingest_rows_total = registry.counter("ingest_rows_total", "Ingested insight rows by result", ("result",))
+ingest_batches_total = registry.counter("ingest_batches_total", "Processed ingest batches by outcome", ("status",))
+ingest_batch_seconds = registry.histogram("ingest_batch_duration_seconds", "Time to coerce and upsert one batch")
+
+@registry.collector
+def ingest_queue_metrics():
+    depth = Gauge("ingest_queue_batches", "Batches in the ingest queue by status", ("status",))
+    db = SessionLocal()
+    try:
+        for status, count in db.query(IngestBatch.status, func.count()).group_by(IngestBatch.status):
+            depth.set(count, status=status)
+    except Exception:
+        # The table may not exist yet (init-db not run); report nothing.
+        pass
+    finally:
+        db.close()
+    return [depth]
+
+def coerce_rows(items: List[dict]) -> Tuple[List[dict], int]:
+    """
+    Validates and coerces a batch of raw Graph rows, treating missing or null
+    metrics as zero like the dashboard endpoints do. Rows without a usable
+    date_start, for a closed day, or with non-numeric metrics, are dropped
+    and counted. Duplicate keys are merged.
+    """
+    rows = []
+    rejected = 0
+    open_from = first_open_day()
+    for item in items:
+        try:
+            day = date.fromisoformat(item["date_start"])
+            if day < open_from:
+                rejected += 1
+                continue
+            rows.append({
+                "date": day,
+                "campaign": item.get("campaign_name") or "unknown",
+                "publisher_platform": item.get("publisher_platform") or "unknown",
+                "clicks": int(item.get("clicks") or 0),
+                "impressions": int(item.get("impressions") or 0),
+                "cpc": float(item.get("cpc") or 0),
+                "ctr": float(item.get("ctr") or 0),
+                "spend": float(item.get("spend") or 0),
+            })
+        except (AttributeError, KeyError, TypeError, ValueError):
+            rejected += 1
+    return merge_rows(rows), rejected
+
+def closed_days(items: List[dict]) -> List[str]:
+    open_from = first_open_day().isoformat()
+    return sorted({
+        item["date_start"] for item in items
+        if isinstance(item, dict) and isinstance(item.get("date_start"), str) and item["date_start"] < open_from
+    })
+
+def enqueue(db: Session, account_id: str, items: List[dict], source: str, complete_days: bool = False) -> IngestBatch:
+    """
+    Appends a batch to the queue. Rejects it with a 422 if it has rows for
+    closed days, or with a 503 once INGEST_QUEUE_LIMIT batches are waiting.
+    """
+    closed = closed_days(items)
+    if closed:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Rows before {first_open_day()} are closed and cannot be ingested (got {', '.join(closed[:5])})",
+        )
+    waiting = db.query(func.count()).select_from(IngestBatch).filter(IngestBatch.status.in_([PENDING, PROCESSING])).scalar()
+    if waiting >= settings.INGEST_QUEUE_LIMIT:
+        raise HTTPException(status_code=503, detail="Ingest queue is full", headers={"Retry-After": "30"})
+    batch = IngestBatch(
+        account_id=account_id,
+        source=source,
+        payload=json.dumps(items),
+        complete_days=complete_days,
+        status=PENDING,
+        rows=len(items),
+    )
+    db.add(batch)
+    db.commit()
+    return batch
+
+def upsert_rows(db: Session, account_id: str, rows: List[dict], synced_at: Optional[datetime] = None) -> int:
+    """
+    Inserts or overwrites rows by their natural key, then refreshes the
+    rollups, all in one transaction. With synced_at the rows are taken as
+    complete for the days they cover: stored rows for those days that the
+    batch no longer has are deleted, and the days are marked synced so
+    dashboard requests do not fetch them again.
+    """
+    if not rows:
+        return 0
+    days = {row["date"] for row in rows}
+    if synced_at:
+        db.query(InsightDaily).filter(
+            InsightDaily.account_id == account_id,
+            InsightDaily.date.in_(days),
+        ).delete(synchronize_session=False)
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    for chunk in chunked(rows, settings.INGEST_CHUNK_SIZE):
+        stmt = dialect.insert(InsightDaily).values([{**row, "account_id": account_id} for row in chunk])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=KEY_COLUMNS,
+            set_={name: stmt.excluded[name] for name in VALUE_COLUMNS},
+        )
+        db.execute(stmt)
+    if synced_at:
+        for day in days:
+            db.merge(InsightSyncState(account_id=account_id, date=day, synced_at=synced_at))
+        db.flush()
+    refresh_rollups(db, account_id, min(days), max(days))
+    db.commit()
+    cube_cache.invalidate_account(account_id)
+    return len(rows)
+
+def claim_next(db: Session) -> Optional[IngestBatch]:
+    while True:
+        batch_id = (
+            db.query(IngestBatch.id)
+            .filter(IngestBatch.status == PENDING)
+            .order_by(IngestBatch.id)
+            .limit(1)
+            .scalar()
+        )
+        if batch_id is None:
+            return None
+        claimed = db.execute(
+            update(IngestBatch)
+            .where(IngestBatch.id == batch_id, IngestBatch.status == PENDING)
+            .values(status=PROCESSING, attempts=IngestBatch.attempts + 1, claimed_at=datetime.utcnow())
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(IngestBatch, batch_id)
+        # Another worker won the race; try the next one.
+
+def process_batch(db: Session, batch: IngestBatch):
+    with ingest_batch_seconds.time():
+        rows, rejected = coerce_rows(json.loads(batch.payload))
+        upserted = upsert_rows(db, batch.account_id, rows, synced_at=batch.created_at if batch.complete_days else None)
+    batch.status = DONE
+    batch.rejected = rejected
+    batch.error = None
+    batch.processed_at = datetime.utcnow()
+    db.commit()
+    ingest_rows_total.inc(upserted, result="upserted")
+    ingest_rows_total.inc(rejected, result="rejected")
+    ingest_batches_total.inc(status=DONE)
+
+def process_next() -> bool:
+    """Claims and processes one batch. Returns False when the queue is empty."""
+    db = SessionLocal()
+    try:
+        batch = claim_next(db)
+        if batch is None:
+            return False
+        try:
+            process_batch(db, batch)
+        except Exception as exc:
+            db.rollback()
+            batch.status = FAILED if batch.attempts >= settings.INGEST_MAX_ATTEMPTS else PENDING
+            batch.error = repr(exc)
+            db.commit()
+            ingest_batches_total.inc(status=FAILED if batch.status == FAILED else "retry")
+            logger.exception("Ingest batch %s failed (attempt %s)", batch.id, batch.attempts)
+        return True
+    finally:
+        db.close()
+
+def drain() -> int:
+    processed = 0
+    while process_next():
+        processed += 1
+    return processed
+
+def replay(db: Session, ids: Optional[List[int]] = None, failed: bool = False, stale_minutes: Optional[float] = None) -> int:
+    """
+    Puts batches back in the queue: the given ids (including finished ones,
+    whose payload is kept), every failed batch, and batches stuck in
+    processing for longer than stale_minutes (e.g. after a worker crash).
+    """
+    conditions = []
+    if ids:
+        conditions.append(IngestBatch.id.in_(ids))
+    if failed:
+        conditions.append(IngestBatch.status == FAILED)
+    if stale_minutes is not None:
+        cutoff = datetime.utcnow() - timedelta(minutes=stale_minutes)
+        conditions.append((IngestBatch.status == PROCESSING) & (IngestBatch.claimed_at < cutoff))
+    if not conditions:
+        return 0
+    condition = conditions[0]
+    for extra in conditions[1:]:
+        condition = condition | extra
+    count = db.execute(
+        update(IngestBatch).where(condition).values(status=PENDING, attempts=0, error=None)
+    ).rowcount
+    db.commit()
+    return count
+
+class IngestWorker:
+    """Drains the queue in a worker thread so the event loop keeps serving requests."""
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                if await asyncio.to_thread(process_next):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ingest worker error")
+            await asyncio.sleep(self.poll_seconds)
+
+ingest_worker = IngestWorker(settings.INGEST_POLL_SECONDS)
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the insights ingest queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue_cmd = commands.add_parser("enqueue", help="Queue raw Graph rows from a JSON file")
+    enqueue_cmd.add_argument("file", help="JSON list of rows, or a Graph response with a 'data' list")
+    enqueue_cmd.add_argument("--account", default=settings.FB_AD_ACCOUNT_ID, help="Ad account id")
+    enqueue_cmd.add_argument("--complete", action="store_true", help="Rows cover whole days; mark them synced")
+    commands.add_parser("drain", help="Process every pending batch and exit")
+    replay_cmd = commands.add_parser("replay", help="Re-queue batches")
+    replay_cmd.add_argument("--ids", help="Comma-separated batch ids")
+    replay_cmd.add_argument("--failed", action="store_true", help="Re-queue every failed batch")
+    replay_cmd.add_argument("--stale-minutes", type=float, help="Re-queue batches stuck in processing this long")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "enqueue":
+        with open(args.file) as f:
+            items = json.load(f)
+        if isinstance(items, dict):
+            items = items.get("data", [])
+        db = SessionLocal()
+        try:
+            batch = enqueue(db, args.account, items, source="cli", complete_days=args.complete)
+            print(f"Queued batch {batch.id} with {len(items)} row(s)")
+        finally:
+            db.close()
+    elif args.command == "drain":
+        started = time.perf_counter()
+        processed = drain()
+        print(f"Processed {processed} batch(es) in {time.perf_counter() - started:.1f}s")
+    else:
+        ids = [int(i) for i in args.ids.split(",")] if args.ids else None
+        db = SessionLocal()
+        try:
+            count = replay(db, ids=ids, failed=args.failed, stale_minutes=args.stale_minutes)
+        finally:
+            db.close()
+        print(f"Re-queued {count} batch(es)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+from datetime import date, timedelta
+from typing import Optional
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from app.database import SessionLocal, init_db
+from app.insights.aggregate import bucket_expression
+from app.models import InsightCampaignDaily, InsightCampaignMonthly, InsightCampaignTotal, InsightDaily
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def _month_end(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+def refresh_rollups(db: Session, account_id: str, since: date, until: date):
+    """
+    Rebuilds the campaign rollups touched by new rows in [since, until]:
+    the daily rollup for those dates, the monthly rollup for their months and
+    the all-time rollup for the campaigns involved. Runs inside the caller's
+    transaction and does not commit.
+    """
+    campaigns = set(db.scalars(
+        select(InsightCampaignDaily.campaign).distinct().where(
+            InsightCampaignDaily.account_id == account_id,
+            InsightCampaignDaily.date.between(since, until),
+        )
+    ))
+
+    db.execute(delete(InsightCampaignDaily).where(
+        InsightCampaignDaily.account_id == account_id,
+        InsightCampaignDaily.date.between(since, until),
+    ))
+    db.execute(insert(InsightCampaignDaily).from_select(
+        ["account_id", "date", "campaign", "clicks", "impressions", "spend"],
+        select(
+            InsightDaily.account_id,
+            InsightDaily.date,
+            InsightDaily.campaign,
+            func.sum(InsightDaily.clicks),
+            func.sum(InsightDaily.impressions),
+            func.sum(InsightDaily.spend),
+        )
+        .where(InsightDaily.account_id == account_id, InsightDaily.date.between(since, until))
+        .group_by(InsightDaily.account_id, InsightDaily.date, InsightDaily.campaign),
+    ))
+    campaigns.update(db.scalars(
+        select(InsightCampaignDaily.campaign).distinct().where(
+            InsightCampaignDaily.account_id == account_id,
+            InsightCampaignDaily.date.between(since, until),
+        )
+    ))
+
+    month_from, month_to = _month_start(since), _month_end(until)
+    month = bucket_expression(db, "month", InsightCampaignDaily.date)
+    db.execute(delete(InsightCampaignMonthly).where(
+        InsightCampaignMonthly.account_id == account_id,
+        InsightCampaignMonthly.month.between(month_from, month_to),
+    ))
+    db.execute(insert(InsightCampaignMonthly).from_select(
+        ["account_id", "month", "campaign", "clicks", "impressions", "spend"],
+        select(
+            InsightCampaignDaily.account_id,
+            month,
+            InsightCampaignDaily.campaign,
+            func.sum(InsightCampaignDaily.clicks),
+            func.sum(InsightCampaignDaily.impressions),
+            func.sum(InsightCampaignDaily.spend),
+        )
+        .where(
+            InsightCampaignDaily.account_id == account_id,
+            InsightCampaignDaily.date.between(month_from, month_to),
+        )
+        .group_by(InsightCampaignDaily.account_id, month, InsightCampaignDaily.campaign),
+    ))
+
+    if not campaigns:
+        return
+    db.execute(delete(InsightCampaignTotal).where(
+        InsightCampaignTotal.account_id == account_id,
+        InsightCampaignTotal.campaign.in_(campaigns),
+    ))
+    db.execute(insert(InsightCampaignTotal).from_select(
+        ["account_id", "campaign", "first_date", "last_date", "clicks", "impressions", "spend"],
+        select(
+            InsightCampaignDaily.account_id,
+            InsightCampaignDaily.campaign,
+            func.min(InsightCampaignDaily.date),
+            func.max(InsightCampaignDaily.date),
+            func.sum(InsightCampaignDaily.clicks),
+            func.sum(InsightCampaignDaily.impressions),
+            func.sum(InsightCampaignDaily.spend),
+        )
+        .where(
+            InsightCampaignDaily.account_id == account_id,
+            InsightCampaignDaily.campaign.in_(campaigns),
+        )
+        .group_by(InsightCampaignDaily.account_id, InsightCampaignDaily.campaign),
+    ))
+
+def rebuild_rollups(db: Session, account_id: Optional[str] = None):
+    """Rebuilds every rollup from insights_daily, e.g. after a backfill."""
+    query = db.query(InsightDaily.account_id, func.min(InsightDaily.date), func.max(InsightDaily.date))
+    if account_id:
+        query = query.filter(InsightDaily.account_id == account_id)
+    for account, first_day, last_day in query.group_by(InsightDaily.account_id).all():
+        refresh_rollups(db, account, first_day, last_day)
+    db.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the campaign insights rollups")
+    parser.add_argument("--account", help="Only rebuild this ad account")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db, args.account)
+    finally:
+        db.close()
+    print("Rollups rebuilt")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Keeps the date windows the dashboard asks for most (current month, last 30
+days, previous month, and the all-time history) synced ahead of time, so
+first viewers read warm rows instead of waiting on Graph.
+
+Every worker runs the loop, but each cycle starts by taking the
+"insights-prewarm" lease in the database; only the holder refreshes. The
+lease outlives two cycles, so if its holder dies another worker takes over.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.insights.sync import history_window, sync_range
+from app.metrics import registry
+from app.models import Lease
+
+logger = logging.getLogger("app.insights.scheduler")
+
+LEASE_NAME = "insights-prewarm"
+
+prewarm_runs_total = registry.counter(
+    "insights_prewarm_runs_total", "Pre-warm cycles by outcome", ("result",)
+)
+
+def standard_windows(today: date) -> List[Tuple[date, date]]:
+    month_start = today.replace(day=1)
+    previous_end = month_start - timedelta(days=1)
+    return [
+        (month_start, today),
+        (today - timedelta(days=29), today),
+        (previous_end.replace(day=1), previous_end),
+        history_window(today),
+    ]
+
+def acquire_lease(db: Session, name: str, owner: str, ttl: float, now: Optional[datetime] = None) -> bool:
+    """
+    Takes or renews the named lease. Succeeds when nobody holds it, when
+    ``owner`` already does, or when the current holder's lease has expired.
+    """
+    now = now or datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    taken = db.execute(
+        update(Lease)
+        .where(Lease.name == name, (Lease.owner == owner) | (Lease.expires_at < now))
+        .values(owner=owner, expires_at=expires_at)
+    ).rowcount
+    if not taken:
+        db.add(Lease(name=name, owner=owner, expires_at=expires_at))
+        try:
+            db.flush()
+            taken = 1
+        except IntegrityError:
+            # Someone else holds a live lease.
+            db.rollback()
+            return False
+    db.commit()
+    return bool(taken)
+
+def release_lease(db: Session, name: str, owner: str):
+    db.query(Lease).filter(Lease.name == name, Lease.owner == owner).delete(synchronize_session=False)
+    db.commit()
+
+class InsightsScheduler:
+    def __init__(self, interval: float, jitter: float):
+        self.interval = interval
+        self.jitter = jitter
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._release_lease)
+
+    def _holds_lease(self) -> bool:
+        db = SessionLocal()
+        try:
+            return acquire_lease(db, LEASE_NAME, self.owner, ttl=self.interval * 2 + self.jitter)
+        finally:
+            db.close()
+
+    def _release_lease(self):
+        db = SessionLocal()
+        try:
+            release_lease(db, LEASE_NAME, self.owner)
+        finally:
+            db.close()
+
+    async def run_once(self) -> bool:
+        """Refreshes every standard window if this worker holds the lease."""
+        if not await asyncio.to_thread(self._holds_lease):
+            prewarm_runs_total.inc(result="skipped")
+            return False
+        # Refresh still-changing days early enough that none of them reaches
+        # INSIGHTS_REFRESH_SECONDS (when a viewer would sync it) before the
+        # next cycle comes round.
+        refresh_seconds = max(0.0, settings.INSIGHTS_REFRESH_SECONDS - self.interval - self.jitter)
+        for since, until in standard_windows(date.today()):
+            await sync_range(since, until, refresh_seconds=refresh_seconds)
+        prewarm_runs_total.inc(result="ok")
+        return True
+
+    async def _loop(self):
+        # Jitter keeps workers that booted together from hitting the lease
+        # (and Graph) in lockstep.
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                prewarm_runs_total.inc(result="error")
+                logger.exception("Insights pre-warm failed")
+            await asyncio.sleep(self.interval + random.uniform(0, self.jitter))
+
+insights_scheduler = InsightsScheduler(settings.INSIGHTS_PREWARM_SECONDS, settings.INSIGHTS_PREWARM_JITTER)
@@ -0,0 +1,202 @@
+"""
+Server-sent insight updates.
+
+Subscribers of the same (account, token, since, until) share a Topic. Each
+Topic runs one refresher task that re-checks the token's access and syncs
+the range with it every STREAM_REFRESH_SECONDS (sync_range coalesces with
+dashboard requests), then diffs the result against the previous snapshot.
+Only changed and removed rows are broadcast; a token that loses access ends
+its streams. Each connection holds at most STREAM_QUEUE_SIZE pending events.
+A connection that falls behind drops its backlog and gets a fresh snapshot
+instead, so a slow client cannot grow the worker's memory.
+"""
+import asyncio
+import itertools
+import logging
+from datetime import date
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import orjson
+from fastapi import HTTPException
+from app.config import settings
+from app.database import SessionLocal
+from app.insights.accounts import AccountRef, can_read, token_fingerprint
+from app.insights.cube import cube_cache
+from app.insights.graph import is_access_error
+from app.insights.sync import sync_range
+from app.metrics import Gauge, registry
+
+logger = logging.getLogger("app.insights.stream")
+
+METRICS = ("clicks", "impressions", "spend", "cpc", "ctr")
+Key = Tuple[str, str, str]
+
+stream_events_total = registry.counter("insights_stream_events_total", "SSE events queued by type", ("event",))
+
+def _snapshot(account_id: str, since: date, until: date) -> Dict[Key, tuple]:
+    db = SessionLocal()
+    try:
+        cube = cube_cache.get(db, [account_id], since, until)
+    finally:
+        db.close()
+    keys = zip(cube.decode("date").tolist(), cube.decode("campaign").tolist(), cube.decode("publisher_platform").tolist())
+    values = zip(*[cube.metrics[name].tolist() for name in METRICS])
+    return dict(zip(keys, values))
+
+def _row(key: Key, values: tuple) -> dict:
+    return {"date": key[0], "campaign": key[1], "publisher_platform": key[2], **dict(zip(METRICS, values))}
+
+def diff(old: Dict[Key, tuple], new: Dict[Key, tuple]) -> Tuple[List[dict], List[dict]]:
+    changed = [_row(key, values) for key, values in new.items() if old.get(key) != values]
+    removed = [
+        {"date": key[0], "campaign": key[1], "publisher_platform": key[2]}
+        for key in old.keys() - new.keys()
+    ]
+    return changed, removed
+
+def format_event(event: str, data: dict, event_id: Optional[int] = None) -> bytes:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\n".encode() + b"data: " + orjson.dumps(data) + b"\n\n"
+
+class Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.needs_snapshot = True
+
+    def offer(self, event: bytes):
+        if self.needs_snapshot:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: forget the backlog and resync with a snapshot.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.needs_snapshot = True
+            self.wake()
+            stream_events_total.inc(event="overflow")
+
+    def wake(self):
+        # An empty event only makes the connection loop look at its state again.
+        if not self.queue.full():
+            self.queue.put_nowait(b"")
+
+class Topic:
+    def __init__(self, key: tuple, access_token: Optional[str], interval: float):
+        self.key = key
+        self.access_token = access_token
+        self.interval = interval
+        self.subscribers: Set[Subscriber] = set()
+        self.snapshot: Optional[Dict[Key, tuple]] = None
+        self.ready = asyncio.Event()
+        # Set when the token loses access; subscribers are then disconnected.
+        self.revoked = False
+        self.ids = itertools.count(1)
+        self.last_id = 0
+        self._task = asyncio.create_task(self._run())
+
+    async def refresh(self):
+        account_id, _, since, until = self.key
+        if not await can_read(AccountRef(account_id, self.access_token)):
+            self.revoke()
+            return
+        await sync_range(since, until, account_id=account_id, access_token=self.access_token)
+        # Building the cube is CPU and database work; keep it off the loop.
+        snapshot = await asyncio.to_thread(_snapshot, account_id, since, until)
+        if self.snapshot is not None:
+            changed, removed = diff(self.snapshot, snapshot)
+            if changed or removed:
+                self.last_id = next(self.ids)
+                event = format_event("update", {"changed": changed, "removed": removed}, self.last_id)
+                for subscriber in list(self.subscribers):
+                    subscriber.offer(event)
+                stream_events_total.inc(len(self.subscribers), event="update")
+        self.snapshot = snapshot
+        self.ready.set()
+
+    async def _run(self):
+        while not self.revoked:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                if isinstance(error, HTTPException) and is_access_error(error):
+                    logger.warning("Insights stream token lost access to account %s", self.key[0])
+                    self.revoke()
+                    continue
+                logger.exception("Insights stream refresh failed for account %s", self.key[0])
+                if self.snapshot is None:
+                    # Let subscribers start from empty; the next successful
+                    # refresh sends every row as changed.
+                    self.snapshot = {}
+                    self.ready.set()
+            await asyncio.sleep(self.interval)
+
+    def revoke(self):
+        self.revoked = True
+        self.ready.set()
+        for subscriber in list(self.subscribers):
+            subscriber.wake()
+
+    def close(self):
+        self._task.cancel()
+
+class StreamHub:
+    def __init__(self):
+        self.topics: Dict[tuple, Topic] = {}
+
+    @property
+    def connections(self) -> int:
+        return sum(len(topic.subscribers) for topic in self.topics.values())
+
+    def full(self) -> bool:
+        return self.connections >= settings.STREAM_MAX_CONNECTIONS
+
+    async def subscribe(self, account: AccountRef, since: date, until: date) -> AsyncIterator[bytes]:
+        key = (account.account_id, token_fingerprint(account.access_token), since, until)
+        topic = self.topics.get(key)
+        if topic is None or topic.revoked:
+            topic = self.topics[key] = Topic(key, account.access_token, settings.STREAM_REFRESH_SECONDS)
+        subscriber = Subscriber(settings.STREAM_QUEUE_SIZE)
+        topic.subscribers.add(subscriber)
+        try:
+            while not topic.ready.is_set():
+                try:
+                    await asyncio.wait_for(topic.ready.wait(), settings.STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+            while not topic.revoked:
+                if subscriber.needs_snapshot:
+                    subscriber.needs_snapshot = False
+                    rows = [_row(k, v) for k, v in topic.snapshot.items()]
+                    stream_events_total.inc(event="snapshot")
+                    yield format_event("snapshot", {"rows": rows}, topic.last_id)
+                    continue
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), settings.STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # SSE comment line: keeps proxies from closing idle connections.
+                    yield b": ping\n\n"
+                    continue
+                if event:
+                    yield event
+        finally:
+            topic.subscribers.discard(subscriber)
+            if not topic.subscribers and self.topics.get(key) is topic:
+                topic.close()
+                del self.topics[key]
+
+    def close(self):
+        for topic in self.topics.values():
+            topic.close()
+        self.topics.clear()
+
+stream_hub = StreamHub()
+
+@registry.collector
+def stream_metrics():
+    connections = Gauge("insights_stream_connections", "Open SSE connections")
+    connections.set(stream_hub.connections)
+    topics = Gauge("insights_stream_topics", "Distinct account/range streams being refreshed")
+    topics.set(len(stream_hub.topics))
+    return [connections, topics]
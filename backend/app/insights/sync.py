@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from app.cache import AsyncTTLCache
+from app.config import settings
+from app.database import SessionLocal, init_db
+from app.insights.cube import cube_cache
+from app.insights.graph import GraphClient, fetch_daily_insights, graph_client
+from app.insights.rollups import refresh_rollups
+from app.models import InsightDaily, InsightSyncState
+
+# Keyed by (account, since, until). Chart widgets that ask for the same range
+# at the same time share a single sync, and repeats inside the TTL skip it.
+sync_cache = AsyncTTLCache(maxsize=settings.INSIGHTS_CACHE_SIZE, ttl=settings.INSIGHTS_CACHE_TTL)
+
+def first_open_day(today: Optional[date] = None) -> date:
+    """
+    The oldest day Facebook may still revise. Earlier days are closed: once
+    synced they never change, and responses covering only them are cached
+    as immutable.
+    """
+    return (today or date.today()) - timedelta(days=settings.INSIGHTS_ATTRIBUTION_DAYS)
+
+def history_window(today: Optional[date] = None) -> Tuple[date, date]:
+    """
+    The range all-time totals cover: INSIGHTS_HISTORY_DAYS back from today,
+    kept inside the 37 months Graph will return insights for.
+    """
+    today = today or date.today()
+    return today - timedelta(days=settings.INSIGHTS_HISTORY_DAYS), today
+
+def needs_sync(day: date, synced_at: Optional[datetime], now: datetime, refresh_seconds: Optional[float] = None) -> bool:
+    """
+    A day is fetched when it has never been synced, or when it was last synced
+    inside Facebook's attribution window (numbers may still change) and that
+    sync is older than the refresh interval.
+    """
+    if synced_at is None:
+        return True
+    settled = synced_at.date() >= day + timedelta(days=settings.INSIGHTS_ATTRIBUTION_DAYS)
+    if settled:
+        return False
+    if refresh_seconds is None:
+        refresh_seconds = settings.INSIGHTS_REFRESH_SECONDS
+    return (now - synced_at).total_seconds() >= refresh_seconds
+
+def days_to_sync(
+    db: Session,
+    account_id: str,
+    since: date,
+    until: date,
+    now: Optional[datetime] = None,
+    refresh_seconds: Optional[float] = None,
+) -> List[date]:
+    now = now or datetime.utcnow()
+    until = min(until, now.date())
+    states = {
+        s.date: s.synced_at
+        for s in db.query(InsightSyncState).filter(
+            InsightSyncState.account_id == account_id,
+            InsightSyncState.date >= since,
+            InsightSyncState.date <= until,
+        )
+    }
+    days = []
+    day = since
+    while day <= until:
+        if needs_sync(day, states.get(day), now, refresh_seconds):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+def has_synced_days(db: Session, account_ids: List[str], since: date, until: date) -> bool:
+    return db.query(
+        db.query(InsightSyncState).filter(
+            InsightSyncState.account_id.in_(account_ids),
+            InsightSyncState.date >= since,
+            InsightSyncState.date <= until,
+        ).exists()
+    ).scalar()
+
+def contiguous_ranges(days: List[date]) -> List[Tuple[date, date]]:
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] + timedelta(days=1) == day:
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+def merge_rows(rows: List[dict]) -> List[dict]:
+    # Campaign names are not unique on Facebook's side, so fold duplicates
+    # into one row per key, recomputing cpc and ctr from the summed totals.
+    merged: Dict[tuple, dict] = {}
+    for row in rows:
+        key = (row["date"], row["campaign"], row["publisher_platform"])
+        current = merged.get(key)
+        if current is None:
+            merged[key] = dict(row)
+            continue
+        clicks = current["clicks"] + row["clicks"]
+        impressions = current["impressions"] + row["impressions"]
+        spend = current["spend"] + row["spend"]
+        current["clicks"] = clicks
+        current["impressions"] = impressions
+        current["spend"] = spend
+        current["cpc"] = spend / clicks if clicks else 0.0
+        current["ctr"] = clicks / impressions * 100 if impressions else 0.0
+    return list(merged.values())
+
+def store_rows(db: Session, account_id: str, since: date, until: date, rows: List[dict], synced_at: datetime):
+    db.query(InsightDaily).filter(
+        InsightDaily.account_id == account_id,
+        InsightDaily.date >= since,
+        InsightDaily.date <= until,
+    ).delete(synchronize_session=False)
+    db.add_all(InsightDaily(account_id=account_id, **row) for row in merge_rows(rows))
+    day = since
+    while day <= until:
+        db.merge(InsightSyncState(account_id=account_id, date=day, synced_at=synced_at))
+        day += timedelta(days=1)
+    db.flush()
+    refresh_rollups(db, account_id, since, until)
+    db.commit()
+    cube_cache.invalidate_account(account_id)
+
+async def _sync_days(
+    account_id: str,
+    access_token: Optional[str],
+    since: date,
+    until: date,
+    graph: Optional[GraphClient],
+    refresh_seconds: Optional[float] = None,
+) -> int:
+    # The session is only ever used from one worker thread at a time.
+    db = SessionLocal()
+    try:
+        days = await asyncio.to_thread(days_to_sync, db, account_id, since, until, refresh_seconds=refresh_seconds)
+        if not days:
+            return 0
+        if not access_token:
+            raise HTTPException(status_code=500, detail="Missing FB access token or ad account ID")
+
+        synced_at = datetime.utcnow()
+        ranges = contiguous_ranges(days)
+        fetched = await asyncio.gather(*[
+            fetch_daily_insights(account_id, access_token, start, end, graph=graph)
+            for start, end in ranges
+        ])
+        for (start, end), rows in zip(ranges, fetched):
+            await asyncio.to_thread(store_rows, db, account_id, start, end, rows, synced_at)
+        return len(days)
+    finally:
+        db.close()
+
+async def sync_range(
+    since: date,
+    until: date,
+    account_id: Optional[str] = None,
+    access_token: Optional[str] = None,
+    graph: Optional[GraphClient] = None,
+    refresh_seconds: Optional[float] = None,
+) -> int:
+    """
+    Brings the local store up to date for the given range, fetching only the
+    days that are missing or still changing. Returns the number of days fetched.
+    ``refresh_seconds`` overrides INSIGHTS_REFRESH_SECONDS for this call; it
+    is part of the cache key, so an early refresh is never answered by a
+    just-finished sync that used the default threshold.
+    """
+    account_id = account_id or settings.FB_AD_ACCOUNT_ID
+    access_token = access_token or settings.FB_ACCESS_TOKEN
+    if not account_id:
+        raise HTTPException(status_code=500, detail="Missing FB access token or ad account ID")
+    return await sync_cache.get_or_load(
+        (account_id, since, until, refresh_seconds),
+        lambda: _sync_days(account_id, access_token, since, until, graph, refresh_seconds),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync Facebook insights into the local store")
+    parser.add_argument("--since", type=date.fromisoformat, help="Start date in YYYY-MM-DD (default: 90 days ago)")
+    parser.add_argument("--until", type=date.fromisoformat, help="End date in YYYY-MM-DD (default: today)")
+    args = parser.parse_args()
+
+    until = args.until or date.today()
+    since = args.since or until - timedelta(days=90)
+    init_db()
+
+    async def run():
+        try:
+            return await sync_range(since, until)
+        finally:
+            await graph_client.close()
+
+    fetched = asyncio.run(run())
+    print(f"Synced {fetched} day(s) between {since} and {until}")
+
+if __name__ == "__main__":
+    main()
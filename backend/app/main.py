@@ -1,17 +1,75 @@
+import logging
+import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.models.user import User
+from fastapi.responses import PlainTextResponse
+from app import BOOT_STARTED
 from app.auth import routes as auth_routes
-from app.database import Base, engine
+from app.database import dispose_engines, engines, init_db, on_engine_created, warm_pool
 from app.config import settings
-from app.api import facebook
+from app.api import accounts, debug, facebook, ingest
+from app.insights.graph import graph_client
+from app.insights.cube import cube_cache
+from app.insights.ingest import ingest_worker
+from app.insights.scheduler import insights_scheduler
+from app.insights.stream import stream_hub
+from app.auth.google import google_keys
+from app.auth.hashing import password_hasher
+from app.insights.sync import sync_cache
+from app.metrics import Counter, Gauge, MetricsMiddleware, cache_metrics, instrument_pool, pool_metrics, registry
+from app.models import user_cache
+from app.profiling import ProfilingMiddleware, log_slow_queries
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger("app.startup")
+
+boot_seconds = registry.gauge("app_boot_seconds", "Time spent booting this worker by phase", ("phase",))
+
+@on_engine_created
+def instrument_engine(engine, label):
+    instrument_pool(engine, label)
+    log_slow_queries(engine)
+
+registry.collector(pool_metrics(engines))
+registry.collector(cache_metrics({"insights_sync": sync_cache, "insights_cube": cube_cache, "users": user_cache}))
+
+@registry.collector
+def password_hasher_metrics():
+    pending = Gauge("password_hash_pending", "bcrypt calls queued or running")
+    pending.set(password_hasher.pending)
+    rejected = Counter("password_hash_rejected_total", "bcrypt calls rejected with 503")
+    rejected.inc(password_hasher.rejected)
+    return [pending, rejected]
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if settings.DB_INIT_ON_STARTUP:
+        init_db()
+    graph_client.start()
+    password_hasher.start()
+    if settings.DB_WARM_CONNECTIONS > 0:
+        await warm_pool(settings.DB_WARM_CONNECTIONS)
+    if settings.GRAPH_WARMUP and settings.FB_ACCESS_TOKEN:
+        await graph_client.warm_up()
+    if settings.INSIGHTS_PREWARM and settings.FB_ACCESS_TOKEN and settings.FB_AD_ACCOUNT_ID:
+        insights_scheduler.start()
+    if settings.INGEST_WORKER and settings.INGEST_TOKEN:
+        ingest_worker.start()
+    boot_seconds.set(time.perf_counter() - started, phase="startup")
+    logger.info(
+        "Worker ready: import %.0f ms, startup %.0f ms",
+        boot_seconds.value(phase="import") * 1000,
+        boot_seconds.value(phase="startup") * 1000,
+    )
     yield
+    stream_hub.close()
+    await insights_scheduler.stop()
+    await ingest_worker.stop()
+    password_hasher.shutdown()
+    await google_keys.close()
+    await graph_client.close()
+    await dispose_engines()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -19,6 +77,8 @@ allowed_origins = ["http://localhost:3000", "http://localhost:3001"]
 if settings.ENVIRONMENT == "production":
     allowed_origins = [settings.FRONTEND_URL]
 
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -29,3 +89,12 @@ app.add_middleware(
 
 app.include_router(auth_routes.router, prefix="/auth")
 app.include_router(facebook.router, prefix="/api")
+app.include_router(accounts.router, prefix="/api")
+app.include_router(ingest.router, prefix="/api")
+app.include_router(debug.router, prefix="/debug")
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+boot_seconds.set(time.perf_counter() - BOOT_STARTED, phase="import")
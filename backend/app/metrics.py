@@ -0,0 +1,245 @@
+"""
+In-process metrics in the Prometheus text format, served at /metrics.
+
+Metrics are plain module-level objects so any module can record into them
+without extra services; values that already live elsewhere (pool sizes,
+cache counters) are read at scrape time through collectors.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        return []
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def samples(self):
+        for key in sorted(self._counts):
+            counts = self._counts[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(self._sums[key])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, fn: Callable[[], Iterable[Metric]]):
+        """Registers a callable that builds metrics from live state at scrape time."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for metric in collect():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being served", ("method",))
+db_pool_checkout_seconds = registry.histogram(
+    "db_pool_checkout_seconds", "Time spent acquiring a pooled database connection", ("engine",)
+)
+graph_requests_total = registry.counter("graph_api_requests_total", "Graph API HTTP calls by status", ("status",))
+graph_request_seconds = registry.histogram("graph_api_request_duration_seconds", "Graph API call latency")
+graph_pages_per_fetch = registry.histogram(
+    "graph_api_pages_per_fetch", "Pages followed per paginated Graph fetch", buckets=(1, 2, 3, 5, 10, 20, 50, 100)
+)
+password_hash_seconds = registry.histogram(
+    "password_hash_duration_seconds", "bcrypt time including executor queueing", ("op",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+class MetricsMiddleware:
+    """Records per-route latency and in-flight requests for every HTTP call."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(method=method)
+            # The router stores the matched route on the scope; fall back to a
+            # fixed label so unknown paths cannot blow up the label set.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_seconds.observe(time.perf_counter() - start, method=method, route=route, status=status["code"])
+
+def instrument_pool(engine, label: str):
+    """
+    Times every pool checkout for the given sync engine (pass
+    ``async_engine.sync_engine`` for the async one). Wraps the engine rather
+    than the pool so it survives ``engine.dispose()``.
+    """
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return raw_connection(*args, **kwargs)
+        finally:
+            db_pool_checkout_seconds.observe(time.perf_counter() - start, engine=label)
+
+    engine.raw_connection = timed_raw_connection
+
+def pool_metrics(engines: Dict[str, object]) -> Callable[[], Iterable[Metric]]:
+    def collect():
+        size = Gauge("db_pool_size", "Configured pool size", ("engine",))
+        checked_out = Gauge("db_pool_checked_out", "Connections currently checked out", ("engine",))
+        overflow = Gauge("db_pool_overflow", "Connections opened beyond pool_size", ("engine",))
+        for label, engine in engines.items():
+            pool = engine.pool
+            if hasattr(pool, "size"):
+                size.set(pool.size(), engine=label)
+            if hasattr(pool, "checkedout"):
+                checked_out.set(pool.checkedout(), engine=label)
+            if hasattr(pool, "overflow"):
+                overflow.set(pool.overflow(), engine=label)
+        return [size, checked_out, overflow]
+    return collect
+
+def cache_metrics(caches: Dict[str, object]) -> Callable[[], Iterable[Metric]]:
+    def collect():
+        lookups = Counter("cache_lookups_total", "Cache lookups by result", ("cache", "result"))
+        size = Gauge("cache_entries", "Entries currently cached", ("cache",))
+        hit_rate = Gauge("cache_hit_ratio", "Share of lookups served without a new load", ("cache",))
+        for name, cache in caches.items():
+            stats = cache.stats()
+            for result in ("hits", "misses", "coalesced"):
+                lookups.inc(stats[result], cache=name, result=result)
+            size.set(stats["size"], cache=name)
+            hit_rate.set(stats["hit_rate"], cache=name)
+        return [lookups, size, hit_rate]
+    return collect
@@ -1,24 +1,91 @@
 from .user import User
-from app.database import Base, SessionLocal 
-from sqlalchemy.orm import Session
+from .lease import Lease
+from .ad_account import AdAccount
+from .ingest import IngestBatch
+from .insights import (
+    InsightDaily,
+    InsightSyncState,
+    InsightCampaignDaily,
+    InsightCampaignMonthly,
+    InsightCampaignTotal,
+)
+from app.cache import AsyncTTLCache
+from app.config import settings
+from typing import Iterable, List
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 
-print(Base, SessionLocal)
+# email -> CurrentUser snapshot (or None) for get_current_user. Anything that
+# creates, deletes or re-verifies a user must invalidate its entry.
+user_cache = AsyncTTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
 
-def create_user(db: Session, email: str, password: str = None, is_google: bool = False, name: str = None):
+async def create_user(db: AsyncSession, email: str, password: str = None, is_google: bool = False, name: str = None):
     db_user = User(email=email, hashed_password=password, is_google=is_google, name=name)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    user_cache.invalidate(email)
     return db_user
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
 
-def delete_user_by_email(db: Session, email: str):
-    user = get_user_by_email(db, email)
+async def delete_user_by_email(db: AsyncSession, email: str):
+    user = await get_user_by_email(db, email)
     if not user:
         return False
-    db.delete(user)
-    db.commit()
+    await db.execute(delete(AdAccount).where(AdAccount.user_id == user.id))
+    await db.delete(user)
+    await db.commit()
+    user_cache.invalidate(email)
     return True
 
+def chunked(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+async def bulk_delete_users(db: AsyncSession, emails: List[str]) -> int:
+    deleted = 0
+    for chunk in chunked(list(dict.fromkeys(emails)), settings.BULK_CHUNK_SIZE):
+        await db.execute(
+            delete(AdAccount).where(AdAccount.user_id.in_(select(User.id).where(User.email.in_(chunk))))
+        )
+        result = await db.execute(delete(User).where(User.email.in_(chunk)))
+        await db.commit()
+        deleted += result.rowcount
+        for email in chunk:
+            user_cache.invalidate(email)
+    return deleted
+
+async def bulk_verify_users(db: AsyncSession, emails: List[str]) -> int:
+    verified = 0
+    for chunk in chunked(list(dict.fromkeys(emails)), settings.BULK_CHUNK_SIZE):
+        result = await db.execute(
+            update(User)
+            .where(User.email.in_(chunk), User.is_verified.is_not(True))
+            .values(is_verified=True)
+        )
+        await db.commit()
+        verified += result.rowcount
+        for email in chunk:
+            user_cache.invalidate(email)
+    return verified
+
+async def bulk_insert_users(db: AsyncSession, users: List[dict]) -> int:
+    """
+    Inserts user rows with ON CONFLICT (email) DO NOTHING, one transaction per
+    chunk. Returns how many rows were actually created.
+    """
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    created = 0
+    for chunk in chunked(users, settings.BULK_CHUNK_SIZE):
+        result = await db.execute(
+            dialect.insert(User).values(chunk).on_conflict_do_nothing(index_elements=["email"])
+        )
+        await db.commit()
+        created += result.rowcount
+        for row in chunk:
+            user_cache.invalidate(row["email"])
+    return created
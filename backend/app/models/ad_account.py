@@ -0,0 +1,15 @@
+from sqlalchemy import Column, ForeignKey, Integer, String, UniqueConstraint
+from app.database import Base
+
+class AdAccount(Base):
+    __tablename__ = 'ad_accounts'
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    account_id = Column(String, nullable=False)
+    name = Column(String, nullable=True)
+    # Empty only for SHARED_AD_ACCOUNTS, which are read with FB_ACCESS_TOKEN.
+    access_token = Column(String, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'account_id', name='uq_ad_accounts_user_account'),
+    )
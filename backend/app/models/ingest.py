@@ -0,0 +1,26 @@
+from datetime import datetime
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String, Text
+from app.database import Base
+
+class IngestBatch(Base):
+    """A batch of raw Graph insight rows waiting to be written; see app.insights.ingest."""
+    __tablename__ = 'ingest_queue'
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(String, nullable=False)
+    source = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    # Set when the rows are everything Graph has for their days (e.g. from a
+    # sync job), so those days count as synced once written.
+    complete_days = Column(Boolean, nullable=False, default=False)
+    status = Column(String, nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    rows = Column(Integer, nullable=False, default=0)
+    rejected = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_ingest_queue_status_id', 'status', 'id'),
+    )
@@ -0,0 +1,53 @@
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, UniqueConstraint
+from app.database import Base
+
+class InsightDaily(Base):
+    __tablename__ = 'insights_daily'
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(String, nullable=False)
+    date = Column(Date, nullable=False)
+    campaign = Column(String, nullable=False)
+    publisher_platform = Column(String, nullable=False)
+    clicks = Column(Integer, default=0)
+    impressions = Column(Integer, default=0)
+    cpc = Column(Float, default=0.0)
+    ctr = Column(Float, default=0.0)
+    spend = Column(Float, default=0.0)
+
+    __table_args__ = (
+        UniqueConstraint('account_id', 'date', 'campaign', 'publisher_platform', name='uq_insights_daily_key'),
+    )
+
+class InsightSyncState(Base):
+    __tablename__ = 'insights_sync_state'
+    account_id = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    synced_at = Column(DateTime, nullable=False)
+
+class InsightCampaignDaily(Base):
+    __tablename__ = 'insights_campaign_daily'
+    account_id = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    campaign = Column(String, primary_key=True)
+    clicks = Column(Integer, default=0)
+    impressions = Column(Integer, default=0)
+    spend = Column(Float, default=0.0)
+
+class InsightCampaignMonthly(Base):
+    __tablename__ = 'insights_campaign_monthly'
+    account_id = Column(String, primary_key=True)
+    month = Column(Date, primary_key=True)
+    campaign = Column(String, primary_key=True)
+    clicks = Column(Integer, default=0)
+    impressions = Column(Integer, default=0)
+    spend = Column(Float, default=0.0)
+
+class InsightCampaignTotal(Base):
+    __tablename__ = 'insights_campaign_total'
+    account_id = Column(String, primary_key=True)
+    campaign = Column(String, primary_key=True)
+    first_date = Column(Date)
+    last_date = Column(Date)
+    clicks = Column(Integer, default=0)
+    impressions = Column(Integer, default=0)
+    spend = Column(Float, default=0.0)
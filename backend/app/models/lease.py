@@ -0,0 +1,9 @@
+from sqlalchemy import Column, String, DateTime
+from app.database import Base
+
+class Lease(Base):
+    """A named lock held by one worker until expires_at; see app.insights.scheduler."""
+    __tablename__ = 'leases'
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, String, Boolean, Index
 from app.database import Base
 
 class User(Base):
@@ -9,3 +9,10 @@ class User(Base):
     is_google = Column(Boolean, default=False)
     is_verified = Column(Boolean, default=False)
     name = Column(String, nullable=True)
+
+    # text_pattern_ops lets Postgres use these for LIKE 'prefix%' searches
+    # regardless of the database collation.
+    __table_args__ = (
+        Index('ix_users_email_prefix', 'email', postgresql_ops={'email': 'text_pattern_ops'}),
+        Index('ix_users_name_prefix', 'name', postgresql_ops={'name': 'text_pattern_ops'}),
+    )
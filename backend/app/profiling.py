@@ -0,0 +1,199 @@
+"""
+Opt-in request profiling and slow-query logging.
+
+A sampled request (PROFILE_SAMPLE_RATE, or any request carrying the admin
+X-Profile header) runs with a background thread that snapshots Python stacks
+every PROFILE_INTERVAL_MS. On the event loop thread only samples taken while
+the request's own task is running are kept; while it is suspended the sample
+is recorded as ``[awaiting]``, so the profile adds up to wall time. Other
+threads (the threadpool running sync endpoints, the bcrypt pool) cannot be
+told apart per request, so they are recorded process-wide under
+``[other threads]``. The result is kept as collapsed stacks, the input
+format of flamegraph.pl and speedscope. The last PROFILE_KEEP profiles and
+SLOW_QUERY_KEEP slow SQL statements are held in memory for /debug.
+"""
+import asyncio
+import itertools
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Optional
+from sqlalchemy import event
+from app.config import settings
+
+logger = logging.getLogger("app.slow_query")
+
+PROFILE_HEADER = "x-profile"
+
+# Leaf frames that only mean "this thread is idle"; dropping them keeps the
+# threadpool's parked workers out of every profile.
+IDLE_LEAVES = {("threading.py", "wait"), ("queue.py", "get"), ("thread.py", "_worker")}
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", code.co_filename)
+    return f"{module}:{code.co_name}"
+
+def _collapse(frame) -> Optional[str]:
+    leaf = frame.f_code
+    if (leaf.co_filename.rsplit("/", 1)[-1], leaf.co_name) in IDLE_LEAVES:
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+class Profile:
+    def __init__(self, profile_id: int, method: str, path: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now(timezone.utc)
+        self.duration_ms = 0.0
+        self.status: Optional[int] = None
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "samples": self.samples,
+        }
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class SamplingProfiler:
+    """Samples the request task's stack, and other threads', on a fixed interval until stopped."""
+
+    def __init__(self, profile: Profile, interval: float, task: asyncio.Task):
+        self.profile = profile
+        self.interval = interval
+        self.task = task
+        self.loop = task.get_loop()
+        self.loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            running = asyncio.current_task(self.loop) is self.task
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id == self.loop_thread:
+                    # Whatever else the loop is running belongs to other requests.
+                    stack = _collapse(frame) if running else "[awaiting]"
+                else:
+                    stack = _collapse(frame)
+                    stack = stack and f"[other threads];{stack}"
+                if stack:
+                    self.profile.stacks[stack] += 1
+            self.profile.samples += 1
+
+class ProfileStore:
+    def __init__(self, keep: int):
+        self._profiles: Deque[Profile] = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+
+    def new(self, method: str, path: str) -> Profile:
+        return Profile(next(self._ids), method, path)
+
+    def add(self, profile: Profile):
+        self._profiles.append(profile)
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        return next((p for p in self._profiles if p.id == profile_id), None)
+
+    def list(self):
+        return [p.summary() for p in reversed(self._profiles)]
+
+profiles = ProfileStore(settings.PROFILE_KEEP)
+slow_queries: Deque[dict] = deque(maxlen=settings.SLOW_QUERY_KEEP)
+
+def is_profile_admin(token: Optional[str]) -> bool:
+    return bool(settings.PROFILE_ADMIN_TOKEN) and token == settings.PROFILE_ADMIN_TOKEN
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def _should_profile(self, scope) -> bool:
+        headers = dict(scope.get("headers") or [])
+        token = headers.get(PROFILE_HEADER.encode())
+        if token is not None and is_profile_admin(token.decode()):
+            return True
+        return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/debug/") or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiles.new(scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", str(profile.id).encode())]
+            await send(message)
+
+        profiler = SamplingProfiler(profile, settings.PROFILE_INTERVAL_MS / 1000, asyncio.current_task())
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            # Joining waits out the sampler's current interval; keep that off the loop.
+            await asyncio.to_thread(profiler.stop)
+            profiles.add(profile)
+
+def log_slow_queries(engine):
+    """Records statements on the given sync engine slower than SLOW_QUERY_MS."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # after_cursor_execute does not run for a failed statement.
+        if context.execution_context is None or context.connection is None:
+            return
+        starts = context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+        if elapsed_ms < settings.SLOW_QUERY_MS:
+            return
+        entry: Dict = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(elapsed_ms, 3),
+            "statement": statement,
+            "executemany": executemany,
+        }
+        slow_queries.append(entry)
+        logger.warning("Slow query (%.1f ms): %s", elapsed_ms, statement)
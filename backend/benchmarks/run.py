@@ -0,0 +1,333 @@
+"""
+Benchmark and load-test suite for the auth and insights endpoints.
+
+Runs the app in-process against a throwaway SQLite database and the fake
+Graph API, so no Postgres or Facebook token is needed:
+
+    cd backend
+    python -m benchmarks.run                          # every scenario, 1k/100k/1M rows
+    python -m benchmarks.run --sizes 1000 --scenarios login,fb_monthly
+    python -m benchmarks.run --save benchmarks/baselines/main.json
+    python -m benchmarks.run --baseline benchmarks/baselines/main.json
+
+Each scenario reports throughput and p50/p99 latency. With --baseline the run
+exits non-zero when a scenario's p50 regresses by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+SCENARIOS = [
+    "login",
+    "register",
+    "refresh",
+    "current_user",
+    "all_users",
+    "all_users_deep",
+    "all_users_search",
+    "fb_monthly",
+    "fb_monthly_cold",
+    "fb_all_time",
+]
+SIZED = {"all_users", "all_users_deep", "all_users_search", "fb_monthly", "fb_monthly_cold", "fb_all_time"}
+ROW_BUDGET = 2_000_000
+DAYS = 30
+PLATFORMS = ["facebook", "instagram", "audience_network", "messenger"]
+ACCOUNT_ID = "1000"
+RANGE_START = date(2025, 1, 1)
+
+def configure_environment(rounds: int):
+    workdir = tempfile.mkdtemp(prefix="analytics-bench-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "JWT_SECRET": "bench-secret",
+        "GOOGLE_CLIENT_ID": "bench-client",
+        "GOOGLE_CLIENT_SECRET": "bench-secret",
+        "FB_ACCESS_TOKEN": "tok",
+        "FB_AD_ACCOUNT_ID": ACCOUNT_ID,
+        "FB_GRAPH_URL": "http://graph.local/v23.0",
+        "BCRYPT_ROUNDS": str(rounds),
+        "PASSWORD_HASH_QUEUE_LIMIT": "100000",
+        "SLOW_QUERY_MS": "60000",
+        # The pre-warm loop would sync in the background of every scenario.
+        "INSIGHTS_PREWARM": "false",
+        # Cold syncs of the larger sizes take longer than the per-account
+        # default; measure them instead of cutting them off.
+        "ACCOUNT_SYNC_TIMEOUT": "3600",
+    })
+    return workdir
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+async def measure(name, size, requests, concurrency, make_request):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - started
+    result = {
+        "scenario": name,
+        "size": size,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+    }
+    size_label = f"{size:>9}" if size else " " * 9
+    print(
+        f"{name:<18} {size_label} {requests:>6} req  {result['throughput_rps']:>9.1f} req/s  "
+        f"p50 {result['p50_ms']:>9.2f} ms  p99 {result['p99_ms']:>9.2f} ms  errors {errors}"
+    )
+    return result
+
+def seed_users(count, password_hash):
+    from sqlalchemy import delete, insert
+    from app.database import get_engine
+    from app.models import User, user_cache
+
+    user_cache.clear()
+    with get_engine().begin() as conn:
+        conn.execute(delete(User))
+        for start in range(0, count, 50_000):
+            conn.execute(insert(User), [
+                {
+                    "email": f"user{i:07d}@example.com",
+                    "name": f"User {i}",
+                    "hashed_password": password_hash,
+                    "is_google": False,
+                    "is_verified": True,
+                }
+                for i in range(start, min(count, start + 50_000))
+            ])
+
+def seed_insights(rows):
+    from sqlalchemy import delete, insert
+    from app.database import SessionLocal, get_engine
+    from app.insights.rollups import rebuild_rollups
+    from app.insights.sync import history_window, sync_cache
+    from app.models import (
+        InsightCampaignDaily,
+        InsightCampaignMonthly,
+        InsightCampaignTotal,
+        InsightDaily,
+        InsightSyncState,
+    )
+
+    campaigns = max(1, rows // (DAYS * len(PLATFORMS)))
+    settled = datetime.combine(RANGE_START + timedelta(days=DAYS + 30), datetime.min.time())
+    sync_cache.clear()
+    with get_engine().begin() as conn:
+        for model in (InsightDaily, InsightSyncState, InsightCampaignDaily, InsightCampaignMonthly, InsightCampaignTotal):
+            conn.execute(delete(model))
+        batch = []
+        for d in range(DAYS):
+            day = RANGE_START + timedelta(days=d)
+            for c in range(campaigns):
+                for p, platform_name in enumerate(PLATFORMS):
+                    impressions = 1000 + (d * 31 + c * 17 + p * 7) % 4000
+                    clicks = impressions // (10 + (c + p) % 20)
+                    spend = round(clicks * (0.2 + ((c + d) % 10) / 10), 2)
+                    batch.append({
+                        "account_id": ACCOUNT_ID,
+                        "date": day,
+                        "campaign": f"Campaign {c:06d}",
+                        "publisher_platform": platform_name,
+                        "clicks": clicks,
+                        "impressions": impressions,
+                        "spend": spend,
+                        "cpc": spend / clicks if clicks else 0.0,
+                        "ctr": clicks / impressions * 100,
+                    })
+                    if len(batch) >= 50_000:
+                        conn.execute(insert(InsightDaily), batch)
+                        batch = []
+        if batch:
+            conn.execute(insert(InsightDaily), batch)
+        conn.execute(insert(InsightSyncState), [
+            {"account_id": ACCOUNT_ID, "date": RANGE_START + timedelta(days=d), "synced_at": settled}
+            for d in range(DAYS)
+        ])
+        # Mark the rest of the all-time history as synced (with no rows) so
+        # fb_all_time measures the rollup read, not a three-year Graph fetch.
+        since, until = history_window()
+        seeded = {RANGE_START + timedelta(days=d) for d in range(DAYS)}
+        now = datetime.utcnow()
+        conn.execute(insert(InsightSyncState), [
+            {"account_id": ACCOUNT_ID, "date": day, "synced_at": now}
+            for day in (since + timedelta(days=d) for d in range((until - since).days + 1))
+            if day not in seeded
+        ])
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db, ACCOUNT_ID)
+    finally:
+        db.close()
+    return campaigns
+
+def requests_for(size, requested):
+    if not size:
+        return requested
+    return max(3, min(requested, ROW_BUDGET // size))
+
+async def run(args):
+    import httpx
+    from app.auth.hashing import hash_password, password_hasher
+    from app.database import get_engine, init_db
+    from app.insights.fake_graph import FakeGraph
+    from app.insights.graph import graph_client
+    from app.insights.sync import sync_cache
+    from app.main import app
+    from app.models import InsightSyncState
+
+    init_db()
+    password_hasher.start()
+    results = []
+    password = "bench-password"
+    password_hash = hash_password(password)
+    until = (RANGE_START + timedelta(days=DAYS - 1)).isoformat()
+    monthly_params = {"since": RANGE_START.isoformat(), "until": until, "metric": "clicks"}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=600) as client:
+        seed_users(1, password_hash)
+        login = await client.post("/auth/login", json={"email": "user0000000@example.com", "password": password})
+        access_token = login.json()["access_token"]
+        refresh_cookie = login.cookies.get("refresh_token")
+        auth = {"Authorization": f"Bearer {access_token}"}
+
+        unsized = {
+            "login": lambda i: client.post("/auth/login", json={"email": "user0000000@example.com", "password": password}),
+            "register": lambda i: client.post(
+                "/auth/register", json={"name": "Bench", "email": f"new{i}-{time.time_ns()}@example.com", "password": password}
+            ),
+            "refresh": lambda i: client.post("/auth/refresh", cookies={"refresh_token": refresh_cookie}),
+            "current_user": lambda i: client.get("/auth/me", headers=auth),
+        }
+        for name, make_request in unsized.items():
+            if name in args.scenarios:
+                results.append(await measure(name, 0, args.requests, args.concurrency, make_request))
+
+        for size in args.sizes:
+            if SIZED.isdisjoint(args.scenarios):
+                break
+            requests = requests_for(size, args.requests)
+
+            if {"all_users", "all_users_deep", "all_users_search"} & set(args.scenarios):
+                seed_users(size, password_hash)
+                deep_cursor = max(0, size - 150)
+                user_scenarios = {
+                    "all_users": lambda i: client.get("/auth/all-users", params={"limit": 100}),
+                    "all_users_deep": lambda i: client.get("/auth/all-users", params={"limit": 100, "cursor": deep_cursor}),
+                    "all_users_search": lambda i: client.get("/auth/all-users", params={"q": f"user{size // 2:07d}"[:-1]}),
+                }
+                for name, make_request in user_scenarios.items():
+                    if name in args.scenarios:
+                        results.append(await measure(name, size, max(requests, 50), args.concurrency, make_request))
+
+            if {"fb_monthly", "fb_all_time", "fb_monthly_cold"} & set(args.scenarios):
+                campaigns = seed_insights(size)
+                if "fb_monthly" in args.scenarios:
+                    results.append(await measure(
+                        "fb_monthly", size, requests, args.concurrency,
+                        lambda i: client.get("/api/fb-insights/monthly", params=monthly_params),
+                    ))
+                if "fb_all_time" in args.scenarios:
+                    results.append(await measure(
+                        "fb_all_time", size, max(requests, 50), args.concurrency,
+                        lambda i: client.get("/api/fb-insights/all-time", params={"limit": 500}),
+                    ))
+                if "fb_monthly_cold" in args.scenarios and size <= args.max_cold_rows:
+                    fake = FakeGraph(campaigns=campaigns, start=RANGE_START)
+                    await graph_client.close()
+                    graph_client.start(transport=httpx.ASGITransport(app=fake.app))
+
+                    async def cold(i):
+                        # Forget what was synced so every request pays the full
+                        # Graph fetch, parse and store path.
+                        sync_cache.clear()
+                        with get_engine().begin() as conn:
+                            conn.execute(InsightSyncState.__table__.delete())
+                        return await client.get("/api/fb-insights/monthly", params=monthly_params)
+
+                    results.append(await measure("fb_monthly_cold", size, min(requests, 5), 1, cold))
+                    await graph_client.close()
+
+    password_hasher.shutdown()
+    return results
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["size"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["scenario"], result["size"]))
+        if not previous:
+            continue
+        change = (result["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] if previous["p50_ms"] else 0.0
+        marker = "REGRESSION" if change > tolerance else ""
+        print(f"{result['scenario']:<18} {result['size']:>9}  p50 {previous['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f} ms  {change:+7.1%} {marker}")
+        if change > tolerance:
+            regressions.append(result)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the auth and insights endpoints")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Row counts for sized scenarios")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario (scaled down for large sizes)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--max-cold-rows", type=int, default=100_000, help="Largest size to run fb_monthly_cold at")
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a JSON file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before failing")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    args.sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    configure_environment(args.bcrypt_rounds)
+    results = asyncio.run(run(args))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "bcrypt_rounds": args.bcrypt_rounds,
+                "results": results,
+            }, f, indent=2)
+        print(f"Saved {len(results)} results to {args.save}")
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import tempfile
+
+# Settings are read at import time, so configure them before importing app.
+_workdir = tempfile.mkdtemp(prefix="analytics-tests-")
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "JWT_SECRET": "test-secret",
+    "GOOGLE_CLIENT_ID": "test-client-id",
+    "GOOGLE_CLIENT_SECRET": "test-client-secret",
+    "DATABASE_URL": f"sqlite:///{_workdir}/test.db",
+    "FB_ACCESS_TOKEN": "tok",
+    "FB_AD_ACCOUNT_ID": "123",
+    "GRAPH_BACKOFF_BASE": "0",
+    "GRAPH_WARMUP": "false",
+    "INSIGHTS_PREWARM": "false",
+    "INGEST_WORKER": "false",
+    "BCRYPT_ROUNDS": "4",
+})
+
+import httpx
+import pytest
+from app.database import Base, SessionLocal, dispose_engines, get_engine, init_db
+from app.insights.accounts import access_cache
+from app.insights.cube import cube_cache
+from app.insights.fake_graph import FakeGraph
+from app.insights.graph import graph_client
+from app.insights.sync import sync_cache
+from app.models import user_cache
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    init_db()
+    yield
+    asyncio.run(dispose_engines())
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    yield
+    with get_engine().begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    for cache in (sync_cache, access_cache, user_cache):
+        cache.clear()
+    cube_cache.clear()
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def fake_graph():
+    fake = FakeGraph(campaigns=2)
+    asyncio.run(graph_client.close())
+    graph_client.start(transport=httpx.ASGITransport(app=fake.app))
+    yield fake
+    asyncio.run(graph_client.close())
@@ -0,0 +1,55 @@
+import asyncio
+import time
+import httpx
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app.auth import hashing
+from app.auth.hashing import PasswordHasher, hash_password, password_hasher
+from app.main import app
+from app.models.user import User
+
+def test_login_succeeds_when_the_rehash_is_rejected(db, monkeypatch):
+    stored = hash_password("secret")
+    db.add(User(email="user@example.com", hashed_password=stored, is_verified=True))
+    db.commit()
+
+    async def pool_full(password):
+        raise HTTPException(status_code=503, detail="busy")
+
+    monkeypatch.setattr(password_hasher, "needs_update", lambda hashed: True)
+    monkeypatch.setattr(password_hasher, "hash", pool_full)
+    response = TestClient(app).post("/auth/login", json={"email": "user@example.com", "password": "secret"})
+    assert response.status_code == 200
+    db.expire_all()
+    assert db.query(User).one().hashed_password == stored
+
+def test_login_completes_during_a_bulk_import(db, monkeypatch):
+    db.add(User(email="user@example.com", hashed_password=hash_password("secret"), is_verified=True))
+    db.commit()
+    hasher = PasswordHasher(kind="thread", workers=2, queue_limit=100)
+    monkeypatch.setattr("app.auth.routes.password_hasher", hasher)
+
+    def slow_hash(password):
+        time.sleep(0.05)
+        return password
+
+    monkeypatch.setattr(hashing, "hash_password", slow_hash)
+
+    async def scenario():
+        bulk = asyncio.create_task(hasher.hash_many(["x"] * 40))
+        await asyncio.sleep(0.01)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            started = time.perf_counter()
+            response = await client.post("/auth/login", json={"email": "user@example.com", "password": "secret"})
+            elapsed = time.perf_counter() - started
+        # The batch needs two seconds on its one worker; the login is not queued behind it.
+        assert not bulk.done()
+        await bulk
+        return response, elapsed
+
+    try:
+        response, elapsed = asyncio.run(scenario())
+    finally:
+        hasher.shutdown()
+    assert response.status_code == 200
+    assert elapsed < 0.5
@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from app import cache as cache_module
+from app.cache import AsyncTTLCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+def test_entries_expire_after_ttl(clock):
+    cache = AsyncTTLCache(maxsize=4, ttl=10)
+    cache.set("a", 1)
+    clock[0] += 9.9
+    assert cache.get("a") == 1
+    clock[0] += 0.1
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = AsyncTTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+@pytest.mark.anyio
+async def test_concurrent_loads_share_one_result():
+    cache = AsyncTTLCache()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return object()
+
+    results = await asyncio.gather(*[cache.get_or_load("k", load) for _ in range(5)])
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert await cache.get_or_load("k", load) is results[0]
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 4, 1)
+
+@pytest.mark.anyio
+async def test_concurrent_loads_share_one_error_and_do_not_cache_it():
+    cache = AsyncTTLCache()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*[cache.get_or_load("k", load) for _ in range(3)], return_exceptions=True)
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    with pytest.raises(ValueError):
+        await cache.get_or_load("k", load)
+    assert len(calls) == 2
+
+@pytest.mark.anyio
+async def test_cancelled_caller_does_not_cancel_the_shared_load():
+    cache = AsyncTTLCache()
+
+    async def load():
+        await asyncio.sleep(0.01)
+        return "value"
+
+    first = asyncio.ensure_future(cache.get_or_load("k", load))
+    second = asyncio.ensure_future(cache.get_or_load("k", load))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "value"
+    assert cache.get("k") == "value"
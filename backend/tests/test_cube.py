@@ -0,0 +1,154 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from datetime import date, datetime, timedelta
+from fastapi.testclient import TestClient
+from app.insights.cube import CubeCache, InsightsCube
+from app.insights.sync import store_rows
+from app.main import app
+
+SINCE, UNTIL = date(2024, 1, 1), date(2024, 1, 10)
+
+def _row(day, campaign, platform="facebook", clicks=0, impressions=0, spend=0.0):
+    return {
+        "date": day, "campaign": campaign, "publisher_platform": platform,
+        "clicks": clicks, "impressions": impressions, "spend": spend, "cpc": 0.0, "ctr": 0.0,
+    }
+
+def _store(db, rows, account_id="123"):
+    store_rows(db, account_id, SINCE, UNTIL, rows, datetime.utcnow())
+
+def test_group_sum_matches_python_totals(db):
+    rng = random.Random(7)
+    rows = [
+        _row(SINCE + timedelta(days=d), f"c{c}", p, rng.randint(0, 50), rng.randint(0, 500), rng.random() * 10)
+        for d in range(10) for c in range(6) for p in ("facebook", "instagram")
+    ]
+    _store(db, rows)
+    expected = defaultdict(lambda: [0, 0, 0.0])
+    for row in rows:
+        totals = expected[(row["campaign"], row["date"].replace(day=1).isoformat())]
+        totals[0] += row["clicks"]
+        totals[1] += row["impressions"]
+        totals[2] += row["spend"]
+
+    labels, sums = InsightsCube.build(db, ["123"], SINCE, UNTIL).group_sum(["campaign"], "month")
+    got = {
+        (campaign, period): (clicks, impressions, spend)
+        for campaign, period, clicks, impressions, spend in zip(
+            labels["campaign"], labels["period"], sums["clicks"], sums["impressions"], sums["spend"]
+        )
+    }
+    assert got.keys() == expected.keys()
+    for key, (clicks, impressions, spend) in expected.items():
+        assert got[key][:2] == (clicks, impressions)
+        assert abs(got[key][2] - spend) < 1e-6
+
+def test_top_k_skips_groups_without_a_ratio(db):
+    _store(db, [
+        _row(SINCE, "no clicks", clicks=0, impressions=100, spend=10.0),
+        _row(SINCE, "cheap", clicks=10, impressions=100, spend=1.0),
+        _row(SINCE, "pricey", clicks=1, impressions=100, spend=5.0),
+        _row(SINCE, "unseen", clicks=0, impressions=0, spend=0.0),
+    ])
+    cube = InsightsCube.build(db, ["123"], SINCE, UNTIL)
+    labels, sums = cube.top_k("campaign", "cpc", 5, ascending=True)
+    assert labels.tolist() == ["cheap", "pricey"]
+    labels, _ = cube.top_k("campaign", "ctr", 5, ascending=True)
+    assert "unseen" not in labels.tolist()
+    labels, _ = cube.top_k("campaign", "clicks", 5, ascending=True)
+    assert labels.tolist() == ["no clicks", "unseen", "pricey", "cheap"]
+
+def test_top_k_breaks_ties_on_label_across_the_cut(db):
+    campaigns = ["e", "b", "d", "a", "c", "f"]
+    _store(db, [_row(SINCE, name, clicks=5, impressions=50) for name in campaigns] + [_row(SINCE, "z", clicks=9, impressions=50)])
+    cube = InsightsCube.build(db, ["123"], SINCE, UNTIL)
+    labels, sums = cube.top_k("campaign", "clicks", 3)
+    assert labels.tolist() == ["z", "a", "b"]
+    labels, _ = cube.top_k("campaign", "clicks", 2, ascending=True)
+    assert labels.tolist() == ["a", "b"]
+
+def test_top_k_min_impressions(db):
+    _store(db, [_row(SINCE, "big", clicks=1, impressions=1000), _row(SINCE, "small", clicks=50, impressions=10)])
+    labels, _ = InsightsCube.build(db, ["123"], SINCE, UNTIL).top_k("campaign", "clicks", 5, min_impressions=100)
+    assert labels.tolist() == ["big"]
+
+def test_top_endpoint_ranks_cpc_without_zero_click_campaigns(db):
+    _store(db, [
+        _row(SINCE, "spent, no clicks", clicks=0, impressions=100, spend=10.0),
+        _row(SINCE, "cheap", clicks=10, impressions=100, spend=1.0),
+    ])
+    with TestClient(app) as client:
+        response = client.get("/api/fb-insights/top", params={
+            "since": SINCE.isoformat(), "until": UNTIL.isoformat(), "metric": "cpc", "order": "asc",
+        })
+    assert response.status_code == 200
+    assert [row["campaign"] for row in response.json()["data"]] == ["cheap"]
+
+def test_combined_columns_sum_to_range_totals(db):
+    _store(db, [
+        _row(SINCE, "big", clicks=90, impressions=1000, spend=9.0),
+        _row(SINCE, "small", clicks=1, impressions=10, spend=5.0),
+    ])
+    with TestClient(app) as client:
+        response = client.get("/api/fb-insights/combined", params={
+            "since": SINCE.isoformat(), "until": UNTIL.isoformat(),
+        })
+    assert response.status_code == 200
+    columns = response.json()["columns"]
+    # The dashboard derives range CPC and CTR from these sums.
+    assert sum(columns["spend"]) == 14.0
+    assert sum(columns["clicks"]) == 91 and sum(columns["impressions"]) == 1010
+
+def _slow_builds(monkeypatch, result):
+    builds = []
+    started = threading.Event()
+
+    def build(db, account_ids, since, until):
+        builds.append(account_ids)
+        started.set()
+        time.sleep(0.1)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(InsightsCube, "build", staticmethod(build))
+    return builds, started
+
+def test_cube_cache_shares_one_build_between_concurrent_misses(db, monkeypatch):
+    cube = InsightsCube.build(db, ["123"], SINCE, UNTIL)
+    builds, _ = _slow_builds(monkeypatch, cube)
+    cache = CubeCache(max_bytes=10**9, ttl=60)
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: cache.get(None, ["123"], SINCE, UNTIL), range(4)))
+    assert len(builds) == 1
+    assert all(result is cube for result in results)
+    assert cache.stats()["misses"] == 1 and cache.stats()["coalesced"] == 3
+
+def test_cube_cache_shares_build_errors_and_retries(monkeypatch):
+    builds, _ = _slow_builds(monkeypatch, RuntimeError("scan failed"))
+    cache = CubeCache(max_bytes=10**9, ttl=60)
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(cache.get, None, ["123"], SINCE, UNTIL) for _ in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+    assert len(builds) == 1
+    with pytest.raises(RuntimeError):
+        cache.get(None, ["123"], SINCE, UNTIL)
+    assert len(builds) == 2
+
+def test_cube_cache_does_not_keep_a_build_invalidated_midway(db, monkeypatch):
+    cube = InsightsCube.build(db, ["123"], SINCE, UNTIL)
+    builds, started = _slow_builds(monkeypatch, cube)
+    cache = CubeCache(max_bytes=10**9, ttl=60)
+    with ThreadPoolExecutor(1) as pool:
+        first = pool.submit(cache.get, None, ["123"], SINCE, UNTIL)
+        started.wait()
+        cache.invalidate_account("123")
+        first.result()
+    cache.get(None, ["123"], SINCE, UNTIL)
+    assert len(builds) == 2
@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+from app.auth.utils import create_access_token
+from app.main import app
+from app.models import User
+from app.models.ad_account import AdAccount
+
+PARAMS = {"since": "2024-01-01", "until": "2024-01-02"}
+
+def _user_with_account(db, account_id="999"):
+    user = User(email="owner@example.com", hashed_password="x", is_verified=True)
+    db.add(user)
+    db.flush()
+    db.add(AdAccount(user_id=user.id, account_id=account_id, access_token="tok"))
+    db.commit()
+    return {"Authorization": f"Bearer {create_access_token('owner@example.com')}"}
+
+def test_export_reads_the_users_account(db, fake_graph):
+    auth = _user_with_account(db)
+    fake_graph.accounts = ["123", "999"]
+    with TestClient(app) as client:
+        response = client.get("/api/fb-insights/export", params=PARAMS, headers=auth)
+        assert response.status_code == 200
+        assert response.text
+        assert {call["account_id"] for call in fake_graph.calls} == {"999"}
+        missing = client.get("/api/fb-insights/export", params={**PARAMS, "account_id": "555"}, headers=auth)
+        assert missing.status_code == 404
+
+def test_export_checks_account_access(db, fake_graph):
+    auth = _user_with_account(db)
+    fake_graph.accounts = ["123"]
+    with TestClient(app) as client:
+        response = client.get("/api/fb-insights/export", params=PARAMS, headers=auth)
+    assert response.status_code == 403
+    assert not fake_graph.calls
+
+def test_anonymous_export_uses_the_default_account(fake_graph):
+    with TestClient(app) as client:
+        response = client.get("/api/fb-insights/export", params={**PARAMS, "format": "csv"})
+    assert response.status_code == 200
+    assert response.text.startswith("date,campaign,ad,")
+    assert {call["account_id"] for call in fake_graph.calls} == {"123"}
@@ -0,0 +1,126 @@
+import json
+import os
+import time
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+from app.auth import google
+from app.auth.google import TEST_KEY_ID, JWKSCache, KeysUnavailable, verify_id_token, verify_remote
+from app.config import Settings
+from app.main import app
+
+TESTDATA = os.path.join(os.path.dirname(__file__), "testdata")
+
+with open(os.path.join(TESTDATA, "google_test_key.pem")) as f:
+    PRIVATE_KEY = f.read()
+with open(os.path.join(TESTDATA, "google_jwks.json")) as f:
+    TEST_JWK = json.load(f)["keys"][0]
+
+def _keyset(*kids):
+    return {"keys": [dict(TEST_JWK, kid=kid) for kid in kids]}
+
+def _token(kid=TEST_KEY_ID, **overrides):
+    now = int(time.time())
+    claims = {
+        "iss": "https://accounts.google.com",
+        "aud": "test-client-id",
+        "sub": "1",
+        "email": "user@example.com",
+        "email_verified": True,
+        "iat": now,
+        "exp": now + 3600,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, PRIVATE_KEY, algorithm="RS256", headers={"kid": kid})
+
+@pytest.fixture
+def certs(monkeypatch):
+    """Serves `served["keys"]` as Google's certs endpoint and counts fetches."""
+    served = {"keys": _keyset(TEST_KEY_ID), "fetches": 0, "status": 200, "max_age": 3600}
+
+    def handler(request):
+        served["fetches"] += 1
+        if served["status"] != 200:
+            return httpx.Response(served["status"], text="unavailable")
+        return httpx.Response(200, json=served["keys"], headers={"cache-control": f"public, max-age={served['max_age']}"})
+
+    cache = JWKSCache(url="https://certs.test/", path=None, default_ttl=3600, min_refresh=0)
+    cache._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(google, "google_keys", cache)
+    return served, cache
+
+@pytest.mark.anyio
+async def test_valid_token_returns_claims(certs):
+    claims = await verify_id_token(_token())
+    assert claims["email"] == "user@example.com"
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("overrides", [
+    {"exp": int(time.time()) - 60},
+    {"aud": "someone-else"},
+    {"iss": "https://evil.example.com"},
+])
+async def test_rejects_expired_wrong_audience_and_wrong_issuer(certs, overrides):
+    assert await verify_id_token(_token(**overrides)) is None
+
+@pytest.mark.anyio
+async def test_unknown_kid_refetches_rotated_keys(certs):
+    served, _ = certs
+    served["keys"] = _keyset("old-key")
+    assert await verify_id_token(_token(kid="old-key"))
+    served["keys"] = _keyset("new-key")
+    # Still within max-age, so only the unknown kid triggers the refetch.
+    assert await verify_id_token(_token(kid="new-key"))
+    assert served["fetches"] == 2
+    assert await verify_id_token(_token(kid="old-key")) is None
+
+@pytest.mark.anyio
+async def test_unknown_kid_refetch_is_rate_limited(certs):
+    served, cache = certs
+    cache.min_refresh = 60
+    assert await verify_id_token(_token())
+    assert await verify_id_token(_token(kid="unknown")) is None
+    assert served["fetches"] == 1
+
+@pytest.mark.anyio
+async def test_failed_refresh_backs_off_with_stale_keys(certs):
+    served, cache = certs
+    cache.min_refresh = 60
+    served["max_age"] = 0
+    assert await verify_id_token(_token())
+    served["status"] = 503
+    assert await verify_id_token(_token())
+    assert await verify_id_token(_token())
+    assert served["fetches"] == 2
+
+@pytest.mark.anyio
+async def test_failed_first_fetch_backs_off(certs):
+    served, cache = certs
+    cache.min_refresh = 60
+    served["status"] = 503
+    for _ in range(2):
+        with pytest.raises(KeysUnavailable):
+            await verify_id_token(_token())
+    assert served["fetches"] == 1
+
+@pytest.mark.anyio
+async def test_verify_remote_rejects_non_json(certs):
+    _, cache = certs
+    cache._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text="<html>")))
+    assert await verify_remote(_token()) is None
+
+def test_google_login_requires_verified_email(certs):
+    client = TestClient(app)
+    response = client.post("/auth/google-login", json={"token": _token(email_verified=False)})
+    assert response.status_code == 403
+    response = client.post("/auth/google-login", json={"token": _token()})
+    assert response.status_code == 200
+
+def test_jwks_file_needs_test_mode(monkeypatch):
+    monkeypatch.setenv("GOOGLE_JWKS_FILE", os.path.join(TESTDATA, "google_jwks.json"))
+    monkeypatch.delenv("GOOGLE_JWKS_TEST_MODE", raising=False)
+    with pytest.raises(EnvironmentError):
+        Settings()
+    monkeypatch.setenv("GOOGLE_JWKS_TEST_MODE", "true")
+    assert Settings().GOOGLE_JWKS_TEST_MODE
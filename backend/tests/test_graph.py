@@ -0,0 +1,95 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+from app.insights import graph
+from app.insights.graph import GraphClient
+
+URL = "http://graph.test/v23.0/act_123/insights"
+
+def _client(responses):
+    """A GraphClient whose transport answers with ``responses`` in order and records requests."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return responses[len(requests) - 1]
+
+    client = GraphClient()
+    client.start(transport=httpx.MockTransport(handler))
+    return client, requests
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records backoff sleeps instead of waiting them out."""
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(graph.asyncio, "sleep", fake_sleep)
+    return delays
+
+def _run(client, params=None):
+    async def go():
+        try:
+            return await client.get(URL, params or {})
+        finally:
+            await client.close()
+    return asyncio.run(go())
+
+def test_429_honours_retry_after(sleeps):
+    client, requests = _client([
+        httpx.Response(429, headers={"retry-after": "7"}, json={"error": {"code": 4}}),
+        httpx.Response(200, json={"data": [1]}),
+    ])
+    assert _run(client) == {"data": [1]}
+    assert len(requests) == 2
+    # The pause is shared through _throttle rather than slept by the caller.
+    assert len(sleeps) == 1 and 6 < sleeps[0] <= 7
+
+def test_rate_limit_code_in_a_400_is_retried(sleeps):
+    client, requests = _client([
+        httpx.Response(400, json={"error": {"code": 17, "message": "User request limit reached"}}),
+        httpx.Response(200, json={"data": []}),
+    ])
+    assert _run(client) == {"data": []}
+    assert len(requests) == 2
+
+def test_other_4xx_is_raised_without_retrying(sleeps):
+    client, requests = _client([httpx.Response(400, json={"error": {"code": 100, "message": "Invalid parameter"}})])
+    with pytest.raises(HTTPException) as raised:
+        _run(client)
+    assert raised.value.status_code == 400
+    assert raised.value.detail["error"]["code"] == 100
+    assert len(requests) == 1
+
+def test_non_json_errors_keep_the_body_text(sleeps, monkeypatch):
+    monkeypatch.setattr(graph.settings, "GRAPH_MAX_RETRIES", 2)
+    client, requests = _client([httpx.Response(502, text="<html>Bad Gateway</html>")] * 3)
+    with pytest.raises(HTTPException) as raised:
+        _run(client)
+    assert raised.value.status_code == 502
+    assert raised.value.detail == "<html>Bad Gateway</html>"
+    assert len(requests) == 3
+
+@pytest.mark.parametrize("headers, paused", [
+    ({"x-app-usage": '{"call_count": 95, "total_time": 10, "total_cputime": 5}'}, True),
+    ({"x-ad-account-usage": '{"acc_id_util_pct": 91.5, "reset_time_duration": 0}'}, True),
+    # Durations are seconds, not percentages.
+    ({"x-ad-account-usage": '{"acc_id_util_pct": 5, "reset_time_duration": 300}'}, False),
+])
+def test_usage_threshold_pauses_the_next_request(monkeypatch, sleeps, headers, paused):
+    monkeypatch.setattr(graph.settings, "GRAPH_BACKOFF_BASE", 30)
+    client, _ = _client([httpx.Response(200, headers=headers, json={"data": []})] * 2)
+
+    async def go():
+        await client.get(URL, {})
+        await client.get(URL, {})
+        await client.close()
+
+    asyncio.run(go())
+    assert bool(sleeps) == paused
+    assert all(delay > 29 for delay in sleeps)
@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app.insights import ingest
+from app.insights.ingest import coerce_rows, enqueue, ingest_worker, process_next
+from app.main import app
+from app.models import IngestBatch, InsightCampaignTotal, InsightDaily, InsightSyncState
+
+DAY = date.today() - timedelta(days=1)
+CLOSED = date.today() - timedelta(days=30)
+
+def _item(campaign, clicks=1, day=DAY):
+    return {"date_start": day.isoformat(), "campaign_name": campaign, "publisher_platform": "facebook",
+            "clicks": str(clicks), "impressions": "100", "spend": "1.00"}
+
+def _stored(db):
+    return {(row.campaign, row.clicks) for row in db.query(InsightDaily).filter(InsightDaily.account_id == "123")}
+
+def _push(db, items, complete):
+    enqueue(db, "123", items, source="test", complete_days=complete)
+    assert process_next()
+    db.expire_all()
+
+def test_complete_batch_replaces_the_days_it_covers(db):
+    _push(db, [_item("a"), _item("b")], complete=True)
+    assert _stored(db) == {("a", 1), ("b", 1)}
+    _push(db, [_item("a", clicks=5)], complete=True)
+    assert _stored(db) == {("a", 5)}
+    assert db.get(InsightSyncState, ("123", DAY)) is not None
+    assert {row.campaign for row in db.query(InsightCampaignTotal)} == {"a"}
+
+def test_partial_batch_only_upserts(db):
+    _push(db, [_item("a"), _item("b")], complete=False)
+    _push(db, [_item("a", clicks=5)], complete=False)
+    assert _stored(db) == {("a", 5), ("b", 1)}
+    assert db.get(InsightSyncState, ("123", DAY)) is None
+
+def test_closed_days_are_refused(db):
+    with pytest.raises(HTTPException) as error:
+        enqueue(db, "123", [_item("a"), _item("old", day=CLOSED)], source="test")
+    assert error.value.status_code == 422
+    rows, rejected = coerce_rows([_item("a"), _item("old", day=CLOSED)])
+    assert [row["campaign"] for row in rows] == ["a"] and rejected == 1
+
+def test_failed_batch_leaves_the_store_untouched(db, monkeypatch):
+    _push(db, [_item("a"), _item("b")], complete=True)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("rollup failed")
+
+    monkeypatch.setattr(ingest, "refresh_rollups", broken)
+    monkeypatch.setattr(ingest.settings, "INGEST_CHUNK_SIZE", 1)
+    _push(db, [_item("c"), _item("d")], complete=True)
+    assert _stored(db) == {("a", 1), ("b", 1)}
+    batch = db.query(IngestBatch).order_by(IngestBatch.id.desc()).first()
+    assert batch.status == "pending" and "rollup failed" in batch.error
+
+def test_worker_only_runs_with_an_ingest_token(monkeypatch):
+    monkeypatch.setattr(ingest.settings, "INGEST_WORKER", True)
+    monkeypatch.setattr(ingest.settings, "INGEST_TOKEN", None)
+    with TestClient(app):
+        assert ingest_worker._task is None
+    monkeypatch.setattr(ingest.settings, "INGEST_TOKEN", "secret")
+    with TestClient(app) as client:
+        assert ingest_worker._task is not None
+        response = client.post(
+            "/api/ingest/insights",
+            json={"account_id": "act_123", "data": [_item("old", day=CLOSED)]},
+            headers={"X-Ingest-Token": "secret"},
+        )
+        assert response.status_code == 422
+    assert ingest_worker._task is None
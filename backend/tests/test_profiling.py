@@ -0,0 +1,51 @@
+import asyncio
+import time
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, exc, text
+from app import profiling
+from app.profiling import ProfilingMiddleware, log_slow_queries, profiles
+
+def spin_cpu(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+@pytest.mark.anyio
+async def test_profile_only_samples_its_own_task(monkeypatch):
+    monkeypatch.setattr(profiling.settings, "PROFILE_ADMIN_TOKEN", "admin")
+    monkeypatch.setattr(profiling.settings, "PROFILE_INTERVAL_MS", 1)
+    app = FastAPI()
+
+    @app.get("/sleep")
+    async def sleep():
+        await asyncio.sleep(0.2)
+        return {}
+
+    @app.get("/spin")
+    async def spin():
+        await asyncio.sleep(0.02)
+        spin_cpu(0.1)
+        return {}
+
+    transport = httpx.ASGITransport(app=ProfilingMiddleware(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        profiled, _ = await asyncio.gather(
+            client.get("/sleep", headers={"X-Profile": "admin"}),
+            client.get("/spin"),
+        )
+    profile = profiles.get(int(profiled.headers["x-profile-id"]))
+    assert profile.samples > 0
+    assert profile.stacks["[awaiting]"] > 0
+    assert not [stack for stack in profile.stacks if "spin_cpu" in stack]
+
+def test_failed_queries_do_not_leak_timings():
+    engine = create_engine("sqlite://")
+    log_slow_queries(engine)
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(exc.OperationalError):
+                conn.execute(text("SELECT * FROM missing_table"))
+        conn.execute(text("SELECT 1"))
+        assert conn.info["query_start"] == []
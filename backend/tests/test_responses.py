@@ -0,0 +1,68 @@
+from datetime import date, datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from app.api import responses
+from app.api.responses import IMMUTABLE, REVALIDATE, range_cache_control, short_lived
+from app.auth.utils import create_access_token
+from app.insights.sync import store_rows
+from app.main import app
+
+SINCE, UNTIL = date(2024, 1, 1), date(2024, 1, 31)
+PARAMS = {"since": SINCE.isoformat(), "until": UNTIL.isoformat()}
+
+@pytest.fixture
+def stored(db):
+    rows = [
+        {"date": SINCE + timedelta(days=d), "campaign": f"Campaign {c}", "publisher_platform": "facebook",
+         "clicks": d + c, "impressions": 100, "spend": 1.0, "cpc": 0.0, "ctr": 0.0}
+        for d in range(31) for c in range(3)
+    ]
+    store_rows(db, "123", SINCE, UNTIL, rows, datetime.utcnow())
+
+def test_etag_revalidation_returns_304(stored):
+    with TestClient(app) as client:
+        first = client.get("/api/fb-insights/combined", params=PARAMS)
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"')
+        for header in (etag, etag.removeprefix("W/"), f'"other", {etag}', "*"):
+            again = client.get("/api/fb-insights/combined", params=PARAMS, headers={"If-None-Match": header})
+            assert again.status_code == 304 and again.content == b""
+            assert again.headers["etag"] == etag
+        changed = client.get("/api/fb-insights/combined", params=PARAMS, headers={"If-None-Match": 'W/"other"'})
+    assert changed.status_code == 200 and changed.json() == first.json()
+
+def test_gzip_only_when_accepted_and_above_the_threshold(stored, monkeypatch):
+    offloaded = []
+    real_run_in_threadpool = responses.run_in_threadpool
+
+    async def recording(fn, *args, **kwargs):
+        offloaded.append(fn)
+        return await real_run_in_threadpool(fn, *args, **kwargs)
+
+    monkeypatch.setattr(responses, "run_in_threadpool", recording)
+    with TestClient(app) as client:
+        plain = client.get("/api/fb-insights/combined", params=PARAMS, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        gzipped = client.get("/api/fb-insights/combined", params=PARAMS, headers={"Accept-Encoding": "gzip"})
+        assert gzipped.headers["content-encoding"] == "gzip"
+        assert gzipped.json() == plain.json()
+        assert gzipped.headers["vary"] == "Accept-Encoding, Authorization"
+        assert len(offloaded) == 1
+
+        monkeypatch.setattr(responses.settings, "INSIGHTS_COMPRESS_MIN_BYTES", 10**9)
+        small = client.get("/api/fb-insights/combined", params=PARAMS, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+def test_cache_control_policy(stored):
+    today = date(2024, 3, 1)
+    assert range_cache_control(UNTIL, today) == IMMUTABLE
+    assert range_cache_control(today - timedelta(days=1), today) == short_lived()
+    assert range_cache_control(UNTIL, today, failed=["123"]) == REVALIDATE
+    with TestClient(app) as client:
+        anonymous = client.get("/api/fb-insights/combined", params=PARAMS)
+        signed_in = client.get("/api/fb-insights/combined", params=PARAMS, headers={
+            "Authorization": f"Bearer {create_access_token('user@example.com')}",
+        })
+    assert anonymous.headers["cache-control"] == IMMUTABLE
+    # A signed-in user's accounts can change under the same URL.
+    assert signed_in.headers["cache-control"] == REVALIDATE
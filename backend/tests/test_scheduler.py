@@ -0,0 +1,37 @@
+import asyncio
+from datetime import date
+from app.insights import sync
+from app.insights.scheduler import InsightsScheduler, standard_windows
+from app.insights.sync import sync_range
+
+def test_prewarm_is_not_answered_by_a_viewer_sync(monkeypatch):
+    calls = []
+
+    async def fake_sync_days(account_id, access_token, since, until, graph, refresh_seconds=None):
+        calls.append((since, until, refresh_seconds))
+        return 0
+
+    monkeypatch.setattr(sync, "_sync_days", fake_sync_days)
+    monthly = standard_windows(date.today())[0]
+
+    async def scenario():
+        await sync_range(*monthly)
+        return await InsightsScheduler(interval=60, jitter=0).run_once()
+
+    assert asyncio.run(scenario())
+    assert calls[0] == (*monthly, None)
+    # The viewer's cached result for the same window must not stand in for
+    # the early refresh.
+    assert [(since, until) for since, until, _ in calls[1:]] == standard_windows(date.today())
+    assert all(refresh_seconds is not None for _, _, refresh_seconds in calls[1:])
+
+def test_only_the_lease_holder_prewarms(monkeypatch):
+    async def fake_sync_days(*args, **kwargs):
+        return 0
+
+    monkeypatch.setattr(sync, "_sync_days", fake_sync_days)
+    first, second = InsightsScheduler(interval=60, jitter=0), InsightsScheduler(interval=60, jitter=0)
+    assert asyncio.run(first.run_once())
+    assert not asyncio.run(second.run_once())
+    first._release_lease()
+    assert asyncio.run(second.run_once())
@@ -0,0 +1,94 @@
+from datetime import date
+import pytest
+from app.insights import stream
+from app.insights.accounts import AccountRef
+from app.insights.stream import StreamHub, Subscriber, diff
+
+SINCE, UNTIL = date(2024, 1, 1), date(2024, 1, 2)
+ROW_A = ("2024-01-01", "Campaign 1", "facebook")
+ROW_B = ("2024-01-01", "Campaign 2", "facebook")
+
+@pytest.fixture
+def snapshots(monkeypatch):
+    """Replaces the sync and the cube read with a mutable in-memory snapshot."""
+    current = {ROW_A: (1, 10, 1.0, 1.0, 10.0), ROW_B: (2, 20, 2.0, 1.0, 10.0)}
+    syncs = []
+
+    async def fake_sync_range(since, until, account_id=None, access_token=None, **kwargs):
+        syncs.append((account_id, access_token))
+        return 0
+
+    async def allowed(account):
+        return account.access_token != "revoked"
+
+    monkeypatch.setattr(stream, "sync_range", fake_sync_range)
+    monkeypatch.setattr(stream, "_snapshot", lambda account_id, since, until: dict(current))
+    monkeypatch.setattr(stream, "can_read", allowed)
+    monkeypatch.setattr(stream.settings, "STREAM_REFRESH_SECONDS", 3600)
+    return current, syncs
+
+def test_diff_reports_changed_and_removed_rows():
+    old = {ROW_A: (1, 10, 1.0, 1.0, 10.0), ROW_B: (2, 20, 2.0, 1.0, 10.0)}
+    new = {ROW_A: (5, 10, 1.0, 0.2, 50.0)}
+    changed, removed = diff(old, new)
+    assert changed == [{
+        "date": "2024-01-01", "campaign": "Campaign 1", "publisher_platform": "facebook",
+        "clicks": 5, "impressions": 10, "spend": 1.0, "cpc": 0.2, "ctr": 50.0,
+    }]
+    assert removed == [{"date": "2024-01-01", "campaign": "Campaign 2", "publisher_platform": "facebook"}]
+    assert diff(new, new) == ([], [])
+
+@pytest.mark.anyio
+async def test_slow_subscriber_drops_backlog_and_resyncs():
+    subscriber = Subscriber(queue_size=2)
+    subscriber.offer(b"ignored")
+    assert subscriber.queue.empty()
+
+    subscriber.needs_snapshot = False
+    for event in (b"one", b"two", b"three"):
+        subscriber.offer(event)
+    assert subscriber.needs_snapshot
+    assert subscriber.queue.qsize() == 1
+    assert subscriber.queue.get_nowait() == b""
+
+@pytest.mark.anyio
+async def test_update_carries_only_changed_rows(snapshots):
+    current, syncs = snapshots
+    hub = StreamHub()
+    events = hub.subscribe(AccountRef("123", "user-token"), SINCE, UNTIL)
+    first = await events.__anext__()
+    assert first.startswith(b"id: 0\nevent: snapshot\n")
+
+    topic = next(iter(hub.topics.values()))
+    current[ROW_A] = (9, 10, 1.0, 0.1, 90.0)
+    await topic.refresh()
+    update = await events.__anext__()
+    assert update.startswith(b"id: 1\nevent: update\n")
+    assert b"Campaign 1" in update and b"Campaign 2" not in update
+    assert syncs[-1] == ("123", "user-token")
+    await events.aclose()
+
+@pytest.mark.anyio
+async def test_topics_are_shared_per_token_and_torn_down(snapshots):
+    hub = StreamHub()
+    first = hub.subscribe(AccountRef("123", "token-a"), SINCE, UNTIL)
+    second = hub.subscribe(AccountRef("123", "token-a"), SINCE, UNTIL)
+    other = hub.subscribe(AccountRef("123", "token-b"), SINCE, UNTIL)
+    for events in (first, second, other):
+        await events.__anext__()
+    assert len(hub.topics) == 2
+    assert hub.connections == 3
+
+    await first.aclose()
+    assert len(hub.topics) == 2
+    await second.aclose()
+    await other.aclose()
+    assert hub.topics == {}
+    assert hub.connections == 0
+
+@pytest.mark.anyio
+async def test_revoked_token_ends_the_stream(snapshots):
+    hub = StreamHub()
+    events = hub.subscribe(AccountRef("123", "revoked"), SINCE, UNTIL)
+    assert [event async for event in events] == []
+    assert hub.topics == {}
@@ -0,0 +1,112 @@
+import asyncio
+from datetime import date, datetime, timedelta
+import httpx
+from fastapi.testclient import TestClient
+from app.insights import sync
+from app.insights.graph import graph_client
+from app.insights.sync import merge_rows, store_rows, sync_cache, sync_range
+from app.main import app
+from app.models import InsightDaily, InsightSyncState
+
+TODAY = date.today()
+
+def _row(campaign, clicks, impressions, spend, day=date(2024, 1, 1)):
+    return {"date": day, "campaign": campaign, "publisher_platform": "facebook",
+            "clicks": clicks, "impressions": impressions, "spend": spend, "cpc": 0.0, "ctr": 0.0}
+
+def _failing_graph():
+    asyncio.run(graph_client.close())
+    graph_client.start(transport=httpx.MockTransport(
+        lambda request: httpx.Response(500, json={"error": {"message": "Service unavailable", "code": 2}})
+    ))
+
+def test_merge_rows_folds_duplicate_campaign_names():
+    merged = merge_rows([_row("a", 2, 100, 1.0), _row("a", 8, 300, 4.0), _row("b", 1, 10, 1.0)])
+    by_campaign = {row["campaign"]: row for row in merged}
+    assert by_campaign["a"]["clicks"] == 10 and by_campaign["a"]["impressions"] == 400
+    assert by_campaign["a"]["cpc"] == 0.5 and by_campaign["a"]["ctr"] == 2.5
+    assert by_campaign["b"]["clicks"] == 1
+
+def test_store_rows_replaces_the_range(db):
+    synced_at = datetime.utcnow()
+    store_rows(db, "123", date(2024, 1, 1), date(2024, 1, 1), [_row("a", 1, 10, 1.0), _row("b", 1, 10, 1.0)], synced_at)
+    store_rows(db, "123", date(2024, 1, 1), date(2024, 1, 1), [_row("a", 5, 10, 1.0)], synced_at)
+    assert [(row.campaign, row.clicks) for row in db.query(InsightDaily)] == [("a", 5)]
+    assert db.query(InsightSyncState).count() == 1
+
+def test_sync_range_fetches_only_missing_days(db, fake_graph):
+    since, until = date(2024, 1, 1), date(2024, 1, 5)
+    assert asyncio.run(sync_range(date(2024, 1, 2), date(2024, 1, 3))) == 2
+    calls = len(fake_graph.calls)
+    sync_cache.clear()
+    assert asyncio.run(sync_range(since, until)) == 3
+    assert [call["time_range"] for call in fake_graph.calls[calls:]] == [
+        '{"since": "2024-01-01", "until": "2024-01-01"}',
+        '{"since": "2024-01-04", "until": "2024-01-05"}',
+    ]
+    sync_cache.clear()
+    assert asyncio.run(sync_range(since, until)) == 0
+    # 2 campaigns x 4 platforms x 5 days, stored once each.
+    assert db.query(InsightDaily).count() == 40
+
+def test_failed_sync_serves_stored_rows(fake_graph, monkeypatch):
+    params = {"since": (TODAY - timedelta(days=2)).isoformat(), "until": TODAY.isoformat()}
+    with TestClient(app) as client:
+        fresh = client.get("/api/fb-insights/aggregate", params=params)
+        assert fresh.status_code == 200 and "x-insights-failed-accounts" not in fresh.headers
+
+        _failing_graph()
+        sync_cache.clear()
+        monkeypatch.setattr(sync.settings, "INSIGHTS_REFRESH_SECONDS", 0)
+        stale = client.get("/api/fb-insights/aggregate", params=params)
+        assert stale.status_code == 200
+        assert stale.headers["x-insights-failed-accounts"] == "123"
+        assert stale.json()["data"] == fresh.json()["data"]
+
+        sync_cache.clear()
+        monkeypatch.setattr(sync.settings, "FB_ACCESS_TOKEN", None)
+        no_token = client.get("/api/fb-insights/aggregate", params=params)
+        assert no_token.status_code == 200
+        assert no_token.json()["data"] == fresh.json()["data"]
+
+def test_failed_sync_without_stored_rows_is_an_error(fake_graph):
+    with TestClient(app) as client:
+        _failing_graph()
+        response = client.get("/api/fb-insights/monthly", params={"since": "2024-01-01", "until": "2024-01-02"})
+    assert response.status_code == 500
+
+def test_partial_payloads_are_not_cached_as_immutable(db, fake_graph):
+    store_rows(db, "123", date(2024, 1, 1), date(2024, 1, 1), [_row("a", 1, 10, 1.0)], datetime.utcnow())
+    params = {"since": "2024-01-01", "until": "2024-01-31"}
+    with TestClient(app) as client:
+        _failing_graph()
+        for path in ("monthly", "combined", "aggregate", "top"):
+            response = client.get(f"/api/fb-insights/{path}", params=params)
+            assert response.status_code == 200
+            assert response.headers["x-insights-failed-accounts"] == "123"
+            assert response.headers["cache-control"] == "private, no-cache"
+
+        sync_cache.clear()
+        asyncio.run(graph_client.close())
+        graph_client.start(transport=httpx.ASGITransport(app=fake_graph.app))
+        complete = client.get("/api/fb-insights/monthly", params=params)
+    assert complete.headers["cache-control"] == "private, max-age=31536000, immutable"
+
+def test_all_time_syncs_the_history_window_first(fake_graph, monkeypatch):
+    monkeypatch.setattr(sync.settings, "INSIGHTS_HISTORY_DAYS", 10)
+    with TestClient(app) as client:
+        response = client.get("/api/fb-insights/all-time")
+        assert response.status_code == 200
+        body = response.json()
+        assert fake_graph.calls
+        assert body["complete"] and body["since"] == (TODAY - timedelta(days=10)).isoformat()
+        assert [row["campaign"] for row in body["data"]] == sorted(row["campaign"] for row in body["data"])
+        assert len(body["data"]) == 2
+
+        _failing_graph()
+        sync_cache.clear()
+        monkeypatch.setattr(sync.settings, "INSIGHTS_REFRESH_SECONDS", 0)
+        stale = client.get("/api/fb-insights/all-time")
+    assert stale.status_code == 200
+    assert not stale.json()["complete"]
+    assert stale.json()["data"] == body["data"]
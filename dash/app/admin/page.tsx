@@ -11,6 +11,7 @@ interface User {
 export default function AdminPage() {
   const [admin, setAdmin] = useState<User | null>(null);
   const [users, setUsers] = useState<User[]>([]);
+  const [nextCursor, setNextCursor] = useState<number | null>(null);
   const [loading, setLoading] = useState(true);
   const [userToDelete, setUserToDelete] = useState<User | null>(null);
   const modalRef = useRef<HTMLDivElement>(null);
@@ -54,24 +55,25 @@ export default function AdminPage() {
     fetchAdmin();
   }, [router]);
 
-  useEffect(() => {
+  const fetchUsers = async (cursor: number | null = null) => {
     const token = localStorage.getItem("access_token");
+    const query = cursor !== null ? `?cursor=${cursor}` : "";
+    try {
+      const res = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/auth/all-users${query}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
 
-    const fetchUsers = async () => {
-      try {
-        const res = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/auth/all-users`, {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-
-        if (res.ok) {
-          const data = await res.json();
-          setUsers(data.users);
-        }
-      } catch (err) {
-        console.error("Error fetching users:", err);
+      if (res.ok) {
+        const data = await res.json();
+        setUsers((prev) => (cursor !== null ? [...prev, ...data.users] : data.users));
+        setNextCursor(data.next_cursor ?? null);
       }
-    };
+    } catch (err) {
+      console.error("Error fetching users:", err);
+    }
+  };
 
+  useEffect(() => {
     if (admin) fetchUsers();
   }, [admin]);
 
@@ -160,6 +162,14 @@ export default function AdminPage() {
             ))}
           </ul>
         )}
+        {nextCursor !== null && (
+          <button
+            onClick={() => fetchUsers(nextCursor)}
+            className="mt-4 w-full bg-[#35204D] text-white px-4 py-2 cursor-pointer rounded hover:bg-[#281537]"
+          >
+            Load more
+          </button>
+        )}
       </section>
 
       {userToDelete && (
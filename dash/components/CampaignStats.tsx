@@ -42,44 +42,33 @@ export default function CampaignStats({
       const { since, until } = getDateRange()
 
       try {
-        const metrics: Metric[] = ["clicks", "impressions", "cpc", "ctr"]
-
-        const results = await Promise.all(
-          metrics.map(async (metric) => {
-            const res = await fetch(
-              `${process.env.NEXT_PUBLIC_API_BASE_URL}/api/fb-insights/monthly?since=${since}&until=${until}&metric=${metric}`
-            )
-            const json = await res.json()
-
-            if (!res.ok) {
-              const detail = typeof json.detail === "string" ? json.detail : JSON.stringify(json)
-              throw new Error(detail)
-            }
-
-            if (!Array.isArray(json)) {
-              throw new Error(`Expected array but got ${typeof json}: ${JSON.stringify(json)}`)
-            }
-
-            return { metric, data: json }
-          })
+        const res = await fetch(
+          `${process.env.NEXT_PUBLIC_API_BASE_URL}/api/fb-insights/combined?since=${since}&until=${until}`
         )
+        const json = await res.json()
 
-        const aggregatedStats: Stats = {
-          clicks: 0,
-          impressions: 0,
-          cpc: 0,
-          ctr: 0,
+        if (!res.ok) {
+          const detail = typeof json.detail === "string" ? json.detail : JSON.stringify(json)
+          throw new Error(detail)
+        }
+
+        if (!json.columns) {
+          throw new Error(`Expected columnar payload but got: ${JSON.stringify(json)}`)
         }
 
-        for (const result of results) {
-          const values = result.data.map((entry: any) => entry.metric_value ?? 0)
-          const sum = values.reduce((acc, val) => acc + val, 0)
+        const sum = (column: string) =>
+          ((json.columns[column] ?? []) as number[]).reduce((acc, val) => acc + val, 0)
+        const clicks = sum("clicks")
+        const impressions = sum("impressions")
+        const spend = sum("spend")
 
-          if (result.metric === "cpc" || result.metric === "ctr") {
-            aggregatedStats[result.metric] = values.length ? sum / values.length : 0
-          } else {
-            aggregatedStats[result.metric] = sum
-          }
+        // Ratios come from the range totals; averaging per-row cpc/ctr would
+        // weight a 10-impression row the same as a 10,000-impression one.
+        const aggregatedStats: Stats = {
+          clicks,
+          impressions,
+          cpc: clicks ? spend / clicks : 0,
+          ctr: impressions ? (clicks / impressions) * 100 : 0,
         }
 
         setStats(aggregatedStats)